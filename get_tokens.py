@@ -6,38 +6,62 @@ import sys
 import requests
 import json
 import time
+import tempfile
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.cookiejar import DefaultCookiePolicy
 from typing import Optional
 import re
+import locale
+import logging
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-# 确保使用UTF-8编码
-os.environ.setdefault('PYTHONIOENCODING', 'utf-8')
-os.environ.setdefault('PYTHONLEGACYWINDOWSSTDIO', '0')
+# 本模块也会被Token更新服务在进程内加载，输出统一走日志，由调用方的日志配置决定级别和去向
+logger = logging.getLogger(__name__)
 
-# 强制设置UTF-8编码
-import locale
-try:
-    locale.setlocale(locale.LC_ALL, 'C.UTF-8')
-except locale.Error:
+
+def setup_script_environment():
+    """
+    命令行运行时的进程级环境设置（UTF-8编码、locale、标准流、.env、日志）
+    
+    只在作为脚本运行时调用：setlocale不是线程安全的，不能在服务进程的工作线程中执行
+    """
+    # 确保使用UTF-8编码
+    os.environ.setdefault('PYTHONIOENCODING', 'utf-8')
+    os.environ.setdefault('PYTHONLEGACYWINDOWSSTDIO', '0')
+    
+    # 强制设置UTF-8编码
     try:
-        locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+        locale.setlocale(locale.LC_ALL, 'C.UTF-8')
     except locale.Error:
-        pass  # 如果设置失败，继续使用默认设置
-
-# 重新配置标准输入输出流
-if hasattr(sys.stdout, 'reconfigure'):
-    sys.stdout.reconfigure(encoding='utf-8', errors='replace')
-if hasattr(sys.stderr, 'reconfigure'):
-    sys.stderr.reconfigure(encoding='utf-8', errors='replace')
-if hasattr(sys.stdin, 'reconfigure'):
-    sys.stdin.reconfigure(encoding='utf-8', errors='replace')
+        try:
+            locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+        except locale.Error:
+            pass  # 如果设置失败，继续使用默认设置
+    
+    # 重新配置标准输入输出流
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    if hasattr(sys.stderr, 'reconfigure'):
+        sys.stderr.reconfigure(encoding='utf-8', errors='replace')
+    if hasattr(sys.stdin, 'reconfigure'):
+        sys.stdin.reconfigure(encoding='utf-8', errors='replace')
+    
+    # 加载环境变量
+    load_dotenv()
+    
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format='%(message)s',
+        stream=sys.stdout
+    )
 
-# 加载环境变量
-load_dotenv()
 
 class K2ThinkTokenExtractor:
+    # 并发处理账户的线程数
+    MAX_WORKERS = 4
+    
     def __init__(self):
         self.base_url = "https://www.k2think.ai"
         self.login_url = f"{self.base_url}/api/v1/auths/signin"
@@ -50,9 +74,10 @@ class K2ThinkTokenExtractor:
                 'http': proxy_url,
                 'https': proxy_url
             }
-            print(f"使用代理: {proxy_url}")
+            # 代理地址中可能带有认证信息，不输出具体地址
+            logger.info("使用代理连接")
         else:
-            print("未配置代理，直接连接")
+            logger.info("未配置代理，直接连接")
         
         # 基于f12调试信息的请求头
         self.headers = {
@@ -73,6 +98,13 @@ class K2ThinkTokenExtractor:
         }
         
         self.lock = threading.Lock()
+        
+        # 所有登录请求共享一个Session，复用连接池中的TCP+TLS连接
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.MAX_WORKERS))
+        # 不在Session中保存Cookie，避免不同账户的登录互相影响（token直接从Set-Cookie头中提取）
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
 
     def extract_token_from_set_cookie(self, response: requests.Response) -> Optional[str]:
         """从响应的Set-Cookie头中提取token"""
@@ -89,19 +121,19 @@ class K2ThinkTokenExtractor:
         
         return None
 
-    def login_and_get_token(self, email: str, password: str, retry_count: int = 3) -> Optional[str]:
-        """登录并获取token，带重试机制"""
+    def login_and_get_token(self, email: str, password: str, retry_count: int = 3,
+                            cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        """登录并获取token，带重试机制（cancel_event置位后不再发起新的尝试）"""
         login_data = {
             "email": email,
             "password": password
         }
         
         for attempt in range(retry_count):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
             try:
-                session = requests.Session()
-                session.headers.update(self.headers)
-                
-                response = session.post(
+                response = self.session.post(
                     self.login_url,
                     json=login_data,
                     proxies=self.proxies if self.proxies else None,
@@ -116,7 +148,12 @@ class K2ThinkTokenExtractor:
             except Exception as e:
                 if attempt == retry_count - 1:
                     return None
-                time.sleep(2)  # 重试间隔2秒
+                # 重试间隔2秒，取消时立即结束等待
+                if cancel_event is not None:
+                    if cancel_event.wait(2):
+                        return None
+                else:
+                    time.sleep(2)
                 continue
                 
         return None
@@ -126,7 +163,7 @@ class K2ThinkTokenExtractor:
         accounts = []
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
+                for line_number, line in enumerate(f, 1):
                     line = line.strip()
                     if not line:
                         continue
@@ -136,7 +173,7 @@ class K2ThinkTokenExtractor:
                         
                         # Validate required fields
                         if 'email' not in account_data:
-                            print(f"⚠️  警告: 账户配置缺少 'email' 字段，已跳过")
+                            logger.warning("⚠️  警告: 第%d行账户配置缺少 'email' 字段，已跳过", line_number)
                             continue
                         
                         # Support both 'password' (correct) and 'k2_password' (deprecated) for backward compatibility
@@ -144,12 +181,11 @@ class K2ThinkTokenExtractor:
                         if 'password' in account_data:
                             password = account_data['password']
                         elif 'k2_password' in account_data:
-                            print(f"⚠️  警告: 检测到已弃用的 'k2_password' 字段，请使用 'password' 字段")
-                            print(f"   账户: {account_data['email']}")
-                            print(f"   正确格式: {{\"email\": \"...\", \"password\": \"...\"}}")
+                            logger.warning("⚠️  警告: 第%d行检测到已弃用的 'k2_password' 字段，请使用 'password' 字段", line_number)
+                            logger.warning('   正确格式: {"email": "...", "password": "..."}')
                             password = account_data['k2_password']
                         else:
-                            print(f"❌ 错误: 账户 {account_data['email']} 缺少 'password' 字段")
+                            logger.error("❌ 错误: 第%d行账户配置缺少 'password' 字段", line_number)
                             continue
                         
                         accounts.append({
@@ -157,7 +193,7 @@ class K2ThinkTokenExtractor:
                             'password': password
                         })
                     except Exception as e:
-                        print(f"⚠️  警告: 解析账户配置失败: {e}")
+                        logger.warning("⚠️  警告: 第%d行解析账户配置失败: %s", line_number, e)
                         continue
             
             return accounts
@@ -167,62 +203,77 @@ class K2ThinkTokenExtractor:
         except Exception:
             return []
 
-    def save_token(self, token: str, file_path: str = "./tokens.txt"):
-        """保存token到文件"""
+    def write_tokens_file(self, tokens, file_path: str = "./tokens.txt"):
+        """原子性写入tokens文件：先写入同目录的临时文件再替换，读取方不会看到清空或写了一半的文件"""
+        tokens_dir = os.path.dirname(file_path) or "."
+        fd, temp_path = tempfile.mkstemp(dir=tokens_dir, prefix=".tokens-", suffix=".tmp")
         try:
-            with self.lock:
-                with open(file_path, 'a', encoding='utf-8') as f:
-                    f.write(token + '\n')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.writelines(token + '\n' for token in tokens)
+            os.replace(temp_path, file_path)
         except Exception:
-            pass
-
-    def clear_tokens_file(self, file_path: str = "./tokens.txt"):
-        """清空tokens文件，准备写入新的tokens"""
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write('')  # 清空文件
-            print(f"已清空tokens文件: {file_path}")
-        except Exception as e:
-            print(f"清空tokens文件失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
 
-    def process_account(self, account, tokens_file: str = "./tokens.txt"):
-        """处理单个账户"""
-        token = self.login_and_get_token(account['email'], account['password'])
+    def process_account(self, account, tokens: list, cancel_event: Optional[threading.Event] = None):
+        """处理单个账户，成功获取的token追加到tokens列表"""
+        token = self.login_and_get_token(account['email'], account['password'], cancel_event=cancel_event)
         if token:
-            self.save_token(token, tokens_file)
+            with self.lock:
+                tokens.append(token)
             return True
         return False
 
-    def process_all_accounts(self, accounts_file: str = "./accounts.txt", tokens_file: str = "./tokens.txt"):
-        """使用并发处理所有账户"""
+    def process_all_accounts(self, accounts_file: str = "./accounts.txt", tokens_file: str = "./tokens.txt",
+                             cancel_event: Optional[threading.Event] = None):
+        """
+        使用并发处理所有账户
+        
+        cancel_event置位后不再发起新的登录，也不会写入tokens文件（用于调用方超时或停止服务）
+        """
+        if cancel_event is None:
+            cancel_event = threading.Event()
         accounts = self.load_accounts(accounts_file)
         if not accounts:
-            print("没有账户需要处理或accounts.txt文件不存在")
+            logger.warning("没有账户需要处理或accounts.txt文件不存在")
             return False
         
-        # 清空现有的tokens文件
-        self.clear_tokens_file(tokens_file)
+        # 只在开始时确保目录存在一次
+        tokens_dir = os.path.dirname(tokens_file)
+        if tokens_dir:
+            os.makedirs(tokens_dir, exist_ok=True)
         
-        print(f"开始处理 {len(accounts)} 个账户，4线程并发...")
+        logger.info("开始处理 %d 个账户，%d线程并发...", len(accounts), self.MAX_WORKERS)
         success_count = 0
         failed_count = 0
+        tokens = []
         
-        # 先测试单个账户
+        # 先测试单个账户，测试成功获取的token直接计入结果，不再重复登录
         test_account = accounts[0]
-        print(f"测试账户: {test_account['email']}")
+        logger.debug("测试账户: %s", test_account['email'])
         
         try:
-            token = self.login_and_get_token(test_account['email'], test_account['password'])
+            token = self.login_and_get_token(test_account['email'], test_account['password'], cancel_event=cancel_event)
             if token:
-                print(f"测试成功，获取token: {token[:50]}...")
+                logger.info("测试账户登录成功")
+                tokens.append(token)
+                success_count += 1
             else:
-                print("测试失败，无法获取token")
+                logger.warning("测试失败，无法获取token")
+                failed_count += 1
         except Exception as e:
-            print(f"测试异常: {e}")
+            logger.warning("测试异常: %s", e)
+            failed_count += 1
         
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # 提交所有任务
-            future_to_account = {executor.submit(self.process_account, account, tokens_file): account for account in accounts}
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            # 提交剩余账户的任务
+            future_to_account = {
+                executor.submit(self.process_account, account, tokens, cancel_event): account
+                for account in accounts[1:]
+            }
             
             # 处理结果
             for future in as_completed(future_to_account):
@@ -230,30 +281,48 @@ class K2ThinkTokenExtractor:
                 try:
                     if future.result():
                         success_count += 1
-                        print(f"✓ {account['email']}")
+                        logger.debug("✓ %s", account['email'])
                     else:
                         failed_count += 1
-                        print(f"✗ {account['email']}")
+                        logger.debug("✗ %s", account['email'])
                 except Exception as e:
                     failed_count += 1
-                    print(f"✗ {account['email']} - {e}")
+                    logger.debug("✗ %s - %s", account['email'], e)
+        
+        if cancel_event.is_set():
+            logger.warning("账户处理已取消，不写入tokens文件")
+            return False
         
-        print(f"\n处理完成: 成功 {success_count}, 失败 {failed_count}")
+        # 所有账户处理完成后一次性写入tokens文件
+        try:
+            self.write_tokens_file(tokens, tokens_file)
+        except Exception as e:
+            logger.error("写入tokens文件失败: %s", e)
+            return False
+        
+        logger.info("处理完成: 成功 %d, 失败 %d", success_count, failed_count)
         
         # 返回是否有成功获取的token
         return success_count > 0
 
 
+def generate_tokens(accounts_file: str, tokens_file: str, extractor: Optional[K2ThinkTokenExtractor] = None,
+                    cancel_event: Optional[threading.Event] = None) -> bool:
+    """批量登录账户并写入tokens文件，供命令行和Token更新服务在进程内调用"""
+    if extractor is None:
+        extractor = K2ThinkTokenExtractor()
+    return extractor.process_all_accounts(accounts_file, tokens_file, cancel_event)
+
+
 def main():
-    import sys
+    setup_script_environment()
     
     # 支持命令行参数
     accounts_file = sys.argv[1] if len(sys.argv) > 1 else "./accounts.txt"
     # 默认使用 data/tokens.txt 以匹配服务器配置
     tokens_file = sys.argv[2] if len(sys.argv) > 2 else os.getenv("TOKENS_FILE", "data/tokens.txt")
     
-    extractor = K2ThinkTokenExtractor()
-    success = extractor.process_all_accounts(accounts_file, tokens_file)
+    success = generate_tokens(accounts_file, tokens_file)
     
     # 设置退出码
     sys.exit(0 if success else 1)
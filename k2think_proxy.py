@@ -4,7 +4,6 @@ K2Think API 代理服务 - 重构版本
 """
 import os
 import sys
-import time
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
@@ -33,16 +32,18 @@ if hasattr(sys.stderr, 'reconfigure'):
 if hasattr(sys.stdin, 'reconfigure'):
     sys.stdin.reconfigure(encoding='utf-8', errors='replace')
 
-from src.config import Config
+from src.config import CONFIG
 from src.constants import APIConstants
 from src.exceptions import K2ThinkProxyError
 from src.models import ChatCompletionRequest
 from src.api_handler import APIHandler
+from src.response_processor import close_http_client
+from src.utils import current_epoch
 
 # 初始化配置
 try:
-    Config.validate()
-    Config.setup_logging()
+    CONFIG.validate()
+    CONFIG.setup_logging()
 except Exception as e:
     print(f"配置错误: {e}")
     exit(1)
@@ -55,10 +56,10 @@ async def lifespan(app: FastAPI):
     logger.info("K2Think API Proxy 启动中...")
     
     # 如果启用了token自动更新，启动更新服务
-    if Config.ENABLE_TOKEN_AUTO_UPDATE:
-        token_updater = Config.get_token_updater()
+    if CONFIG.ENABLE_TOKEN_AUTO_UPDATE:
+        token_updater = CONFIG.get_token_updater()
         if token_updater.start():
-            logger.info(f"Token自动更新服务已启动 - 更新间隔: {Config.TOKEN_UPDATE_INTERVAL}秒")
+            logger.info(f"Token自动更新服务已启动 - 更新间隔: {CONFIG.TOKEN_UPDATE_INTERVAL}秒")
         else:
             logger.error("Token自动更新服务启动失败")
     else:
@@ -67,10 +68,13 @@ async def lifespan(app: FastAPI):
     yield
     
     # 关闭token更新服务
-    if Config.ENABLE_TOKEN_AUTO_UPDATE and Config._token_updater:
-        Config._token_updater.stop()
+    if CONFIG.ENABLE_TOKEN_AUTO_UPDATE and CONFIG._token_updater:
+        CONFIG._token_updater.stop()
         logger.info("Token自动更新服务已停止")
     
+    # 关闭共享的HTTP客户端
+    await close_http_client()
+    
     logger.info("K2Think API Proxy 关闭中...")
 
 # 创建FastAPI应用
@@ -84,14 +88,14 @@ app = FastAPI(
 # CORS配置
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=Config.CORS_ORIGINS,
+    allow_origins=CONFIG.CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 # 初始化API处理器
-api_handler = APIHandler(Config)
+api_handler = APIHandler(CONFIG)
 
 @app.get("/")
 async def homepage():
@@ -128,15 +132,15 @@ async def homepage():
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    token_manager = Config.get_token_manager()
+    token_manager = CONFIG.get_token_manager()
     token_stats = token_manager.get_token_stats()
     
     return JSONResponse(content={
         "status": "healthy",
-        "timestamp": int(time.time()),
+        "timestamp": current_epoch(),
         "config": {
-            "tool_support": Config.TOOL_SUPPORT,
-            "debug_logging": Config.DEBUG_LOGGING,
+            "tool_support": CONFIG.TOOL_SUPPORT,
+            "debug_logging": CONFIG.DEBUG_LOGGING,
             "note": "思考内容输出现在通过模型名控制"
         },
         "tokens": {
@@ -144,7 +148,7 @@ async def health_check():
             "active": token_stats["active_tokens"],
             "inactive": token_stats["inactive_tokens"],
             "consecutive_failures": token_manager.get_consecutive_failures(),
-            "auto_update_enabled": Config.ENABLE_TOKEN_AUTO_UPDATE
+            "auto_update_enabled": CONFIG.ENABLE_TOKEN_AUTO_UPDATE
         }
     })
 
@@ -166,7 +170,7 @@ async def chat_completions(request: ChatCompletionRequest, auth_request: Request
 @app.get("/admin/tokens/stats")
 async def get_token_stats():
     """获取token池统计信息"""
-    token_manager = Config.get_token_manager()
+    token_manager = CONFIG.get_token_manager()
     stats = token_manager.get_token_stats()
     # 添加连续失效信息
     stats["consecutive_failures"] = token_manager.get_consecutive_failures()
@@ -182,7 +186,7 @@ async def get_token_stats():
 @app.post("/admin/tokens/reset/{token_index}")
 async def reset_token(token_index: int):
     """重置指定索引的token"""
-    token_manager = Config.get_token_manager()
+    token_manager = CONFIG.get_token_manager()
     success = token_manager.reset_token(token_index)
     if success:
         return JSONResponse(content={
@@ -201,7 +205,7 @@ async def reset_token(token_index: int):
 @app.post("/admin/tokens/reset-all")
 async def reset_all_tokens():
     """重置所有token"""
-    token_manager = Config.get_token_manager()
+    token_manager = CONFIG.get_token_manager()
     token_manager.reset_all_tokens()
     return JSONResponse(content={
         "status": "success",
@@ -212,8 +216,8 @@ async def reset_all_tokens():
 async def reload_tokens():
     """重新加载token文件"""
     try:
-        Config.reload_tokens()
-        token_manager = Config.get_token_manager()
+        CONFIG.reload_tokens()
+        token_manager = CONFIG.get_token_manager()
         stats = token_manager.get_token_stats()
         return JSONResponse(content={
             "status": "success",
@@ -232,7 +236,7 @@ async def reload_tokens():
 @app.get("/admin/tokens/consecutive-failures")
 async def get_consecutive_failures():
     """获取连续失效信息"""
-    token_manager = Config.get_token_manager()
+    token_manager = CONFIG.get_token_manager()
     return JSONResponse(content={
         "status": "success",
         "data": {
@@ -242,7 +246,7 @@ async def get_consecutive_failures():
             "upstream_error_threshold": token_manager.upstream_error_threshold,
             "last_upstream_error_time": token_manager.last_upstream_error_time.isoformat() if token_manager.last_upstream_error_time else None,
             "token_pool_size": len(token_manager.tokens),
-            "auto_refresh_enabled": Config.ENABLE_TOKEN_AUTO_UPDATE and len(token_manager.tokens) > 2,
+            "auto_refresh_enabled": CONFIG.ENABLE_TOKEN_AUTO_UPDATE and len(token_manager.tokens) > 2,
             "last_check": "实时检测"
         }
     })
@@ -250,7 +254,7 @@ async def get_consecutive_failures():
 @app.post("/admin/tokens/reset-consecutive")
 async def reset_consecutive_failures():
     """重置连续失效计数"""
-    token_manager = Config.get_token_manager()
+    token_manager = CONFIG.get_token_manager()
     old_count = token_manager.get_consecutive_failures()
     token_manager.reset_consecutive_failures()
     return JSONResponse(content={
@@ -265,13 +269,13 @@ async def reset_consecutive_failures():
 @app.get("/admin/tokens/updater/status")
 async def get_updater_status():
     """获取token更新器状态"""
-    if not Config.ENABLE_TOKEN_AUTO_UPDATE:
+    if not CONFIG.ENABLE_TOKEN_AUTO_UPDATE:
         return JSONResponse(content={
             "status": "disabled",
             "message": "Token自动更新未启用"
         })
     
-    token_updater = Config.get_token_updater()
+    token_updater = CONFIG.get_token_updater()
     status = token_updater.get_status()
     return JSONResponse(content={
         "status": "success",
@@ -281,7 +285,7 @@ async def get_updater_status():
 @app.post("/admin/tokens/updater/force-update")
 async def force_update_tokens():
     """强制更新tokens"""
-    if not Config.ENABLE_TOKEN_AUTO_UPDATE:
+    if not CONFIG.ENABLE_TOKEN_AUTO_UPDATE:
         return JSONResponse(
             status_code=400,
             content={
@@ -290,13 +294,13 @@ async def force_update_tokens():
             }
         )
     
-    token_updater = Config.get_token_updater()
+    token_updater = CONFIG.get_token_updater()
     success = await token_updater.force_update_async()
     
     if success:
         # 更新成功后重新加载token管理器
-        Config.reload_tokens()
-        token_manager = Config.get_token_manager()
+        CONFIG.reload_tokens()
+        token_manager = CONFIG.get_token_manager()
         stats = token_manager.get_token_stats()
         
         return JSONResponse(content={
@@ -316,7 +320,7 @@ async def force_update_tokens():
 @app.post("/admin/tokens/updater/cleanup-temp")
 async def cleanup_temp_files():
     """清理临时文件"""
-    if not Config.ENABLE_TOKEN_AUTO_UPDATE:
+    if not CONFIG.ENABLE_TOKEN_AUTO_UPDATE:
         return JSONResponse(
             status_code=400,
             content={
@@ -325,7 +329,7 @@ async def cleanup_temp_files():
             }
         )
     
-    token_updater = Config.get_token_updater()
+    token_updater = CONFIG.get_token_updater()
     cleaned_count = token_updater.cleanup_all_temp_files()
     
     return JSONResponse(content={
@@ -361,16 +365,16 @@ if __name__ == "__main__":
     import uvicorn
     
     # 配置日志级别
-    log_level = "debug" if Config.DEBUG_LOGGING else "info"
+    log_level = "debug" if CONFIG.DEBUG_LOGGING else "info"
     
-    logger.info(f"启动服务器: {Config.HOST}:{Config.PORT}")
-    logger.info(f"工具支持: {Config.TOOL_SUPPORT}")
+    logger.info(f"启动服务器: {CONFIG.HOST}:{CONFIG.PORT}")
+    logger.info(f"工具支持: {CONFIG.TOOL_SUPPORT}")
     logger.info("思考内容输出: 通过模型名控制 (MBZUAI-IFM/K2-Think vs MBZUAI-IFM/K2-Think-nothink)")
     
     uvicorn.run(
         app, 
-        host=Config.HOST, 
-        port=Config.PORT, 
-        access_log=Config.ENABLE_ACCESS_LOG,
+        host=CONFIG.HOST, 
+        port=CONFIG.PORT, 
+        access_log=CONFIG.ENABLE_ACCESS_LOG,
         log_level=log_level
     )
\ No newline at end of file
@@ -3,17 +3,17 @@ API处理模块
 处理主要的API路由逻辑
 """
 import json
-import time
 import asyncio
 import logging
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
 from fastapi import HTTPException, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 
 from src.config import Config
 from src.constants import (
     APIConstants, ResponseConstants, LogMessages, 
-    ErrorMessages, HeaderConstants
+    ErrorMessages, HeaderConstants, NumericConstants
 )
 from src.exceptions import (
     AuthenticationError, SerializationError, 
@@ -23,10 +23,17 @@ from src.models import ChatCompletionRequest, ModelsResponse, ModelInfo
 from src.tool_handler import ToolHandler
 from src.response_processor import ResponseProcessor
 from src.token_manager import TokenManager
-from src.utils import safe_log_error, safe_log_info, safe_log_warning
+from src.utils import safe_log_error, safe_log_info, safe_log_warning, current_epoch
 
 logger = logging.getLogger(__name__)
 
+# 流式响应头（常量，StreamingResponse内部会复制，无需每次请求重新构建）
+_STREAM_RESPONSE_HEADERS = MappingProxyType({
+    HeaderConstants.CACHE_CONTROL: HeaderConstants.NO_CACHE,
+    HeaderConstants.CONNECTION: HeaderConstants.KEEP_ALIVE,
+    HeaderConstants.X_ACCEL_BUFFERING: HeaderConstants.NO_BUFFERING
+})
+
 class APIHandler:
     """API处理器"""
     
@@ -35,6 +42,7 @@ class APIHandler:
         self.tool_handler = ToolHandler(config)
         self.response_processor = ResponseProcessor(config, self.tool_handler)
         self.token_manager = config.get_token_manager()
+        self._tool_support = config.TOOL_SUPPORT
     
     def validate_api_key(self, authorization: str) -> bool:
         """验证API密钥"""
@@ -84,10 +92,10 @@ class APIHandler:
                 return token
             
             # 仅在第一次失败时触发强制更新
-            if attempt == 0 and Config.ENABLE_TOKEN_AUTO_UPDATE:
+            if attempt == 0 and self.config.ENABLE_TOKEN_AUTO_UPDATE:
                 logging.info("Token池为空，触发自动刷新...")
                 try:
-                    await Config.get_token_updater().force_update_async()
+                    await self.config.get_token_updater().force_update_async()
                 except Exception as e:
                     logging.error(f"触发token刷新失败: {e}")
             
@@ -98,7 +106,7 @@ class APIHandler:
                 delay = min(delay * 2, 5.0)  # 指数退避，最大5秒
         
         # 所有重试失败，返回503错误
-        if Config.ENABLE_TOKEN_AUTO_UPDATE:
+        if self.config.ENABLE_TOKEN_AUTO_UPDATE:
             error_message = "Token池暂时为空。已尝试自动刷新但未成功，请稍后重试或检查 /admin/tokens/updater/status 查看更新器状态。"
             safe_log_warning(logger, "Token刷新失败，请检查K2_EMAIL/K2_PASSWORD配置")
         else:
@@ -117,15 +125,16 @@ class APIHandler:
     
     async def get_models(self) -> ModelsResponse:
         """获取模型列表"""
+        created = current_epoch()
         model_info_standard = ModelInfo(
             id=APIConstants.MODEL_ID,
-            created=int(time.time()),
+            created=created,
             owned_by=APIConstants.MODEL_OWNER,
             root=APIConstants.MODEL_ROOT
         )
         model_info_nothink = ModelInfo(
             id=APIConstants.MODEL_ID_NOTHINK,
-            created=int(time.time()),
+            created=created,
             owned_by=APIConstants.MODEL_OWNER,
             root=APIConstants.MODEL_ROOT
         )
@@ -215,11 +224,12 @@ class APIHandler:
     
     def _check_tools_enabled(self, request: ChatCompletionRequest) -> bool:
         """检查工具是否启用"""
+        # 大多数请求不带tools，先检查最可能短路的条件
         return (
-            self.config.TOOL_SUPPORT and 
             request.tools is not None and 
             len(request.tools) > 0 and 
-            request.tool_choice != "none"
+            request.tool_choice != "none" and 
+            self._tool_support
         )
     
     def _log_request_info(self, raw_messages: List[Dict], has_tools: bool, tools: List):
@@ -294,6 +304,9 @@ class APIHandler:
         # 使用实际的模型ID
         model_id = actual_model_id or APIConstants.MODEL_ID
         
+        # id与session_id表示同一个会话，只生成一次
+        session_id = self.response_processor.generate_session_id()
+        
         return {
             "stream": request.stream,
             "model": model_id,
@@ -321,8 +334,8 @@ class APIHandler:
                 "tags_generation": True
             },
             "chat_id": self.response_processor.generate_chat_id(),
-            "id": self.response_processor.generate_session_id(),
-            "session_id": self.response_processor.generate_session_id()
+            "id": session_id,
+            "session_id": session_id
         }
     
     def _validate_json_serialization(self, k2think_payload: Dict):
@@ -349,13 +362,46 @@ class APIHandler:
                 else HeaderConstants.APPLICATION_JSON
             ),
             HeaderConstants.CONTENT_TYPE: HeaderConstants.APPLICATION_JSON,
-            HeaderConstants.AUTHORIZATION: f"{APIConstants.BEARER_PREFIX}{token}",
-            HeaderConstants.COOKIE: f"token={token}",
+            HeaderConstants.AUTHORIZATION: self.token_manager.get_auth_header(token),
+            HeaderConstants.COOKIE: self.token_manager.get_cookie_header(token),
             HeaderConstants.ORIGIN: "https://www.k2think.ai",
             HeaderConstants.REFERER: "https://www.k2think.ai/c/" + k2think_payload["chat_id"],
             HeaderConstants.USER_AGENT: HeaderConstants.DEFAULT_USER_AGENT
         }
     
+    def _split_tool_content(self, full_content: str) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """从完整内容中解析工具调用，返回(工具调用列表, 消息内容)"""
+        tool_calls = self.tool_handler.extract_tool_invocations(full_content)
+        if tool_calls:
+            # 当存在工具调用时，内容必须为null（OpenAI规范）
+            return tool_calls, None
+        
+        # 从内容中移除工具JSON
+        message_content = self.tool_handler.remove_tool_json_content(full_content)
+        if not message_content:
+            message_content = full_content  # 保留原内容如果清理后为空
+        return None, message_content
+    
+    async def _resolve_tool_content(
+        self, 
+        full_content: str, 
+        has_tools: bool
+    ) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """处理工具调用，较长的内容放到线程中解析，避免阻塞事件循环"""
+        if not has_tools:
+            return None, full_content
+        
+        if full_content and len(full_content) >= NumericConstants.TOOL_PARSE_OFFLOAD_THRESHOLD:
+            tool_calls, message_content = await asyncio.to_thread(self._split_tool_content, full_content)
+        else:
+            tool_calls, message_content = self._split_tool_content(full_content)
+        
+        if tool_calls:
+            safe_log_info(logger, LogMessages.TOOL_CALLS_EXTRACTED.format(
+                json.dumps(tool_calls, ensure_ascii=False)
+            ))
+        return tool_calls, message_content
+    
     async def _handle_stream_response(
         self, 
         k2think_payload: Dict, 
@@ -370,11 +416,7 @@ class APIHandler:
                 k2think_payload, headers, has_tools, output_thinking, original_model
             ),
             media_type=HeaderConstants.TEXT_EVENT_STREAM,
-            headers={
-                HeaderConstants.CACHE_CONTROL: HeaderConstants.NO_CACHE,
-                HeaderConstants.CONNECTION: HeaderConstants.KEEP_ALIVE,
-                HeaderConstants.X_ACCEL_BUFFERING: HeaderConstants.NO_BUFFERING
-            }
+            headers=_STREAM_RESPONSE_HEADERS
         )
     
     async def _handle_non_stream_response(
@@ -391,22 +433,7 @@ class APIHandler:
         )
         
         # 处理工具调用
-        tool_calls = None
-        message_content = full_content
-        
-        if has_tools:
-            tool_calls = self.tool_handler.extract_tool_invocations(full_content)
-            if tool_calls:
-                # 当存在工具调用时，内容必须为null（OpenAI规范）
-                message_content = None
-                safe_log_info(logger, LogMessages.TOOL_CALLS_EXTRACTED.format(
-                    json.dumps(tool_calls, ensure_ascii=False)
-                ))
-            else:
-                # 从内容中移除工具JSON
-                message_content = self.tool_handler.remove_tool_json_content(full_content)
-                if not message_content:
-                    message_content = full_content  # 保留原内容如果清理后为空
+        tool_calls, message_content = await self._resolve_tool_content(full_content, has_tools)
         
         openai_response = self.response_processor.create_completion_response(
             message_content, tool_calls, token_info, original_model
@@ -463,11 +490,7 @@ class APIHandler:
                 return StreamingResponse(
                     stream_generator(),
                     media_type=HeaderConstants.TEXT_EVENT_STREAM,
-                    headers={
-                        HeaderConstants.CACHE_CONTROL: HeaderConstants.NO_CACHE,
-                        HeaderConstants.CONNECTION: HeaderConstants.KEEP_ALIVE,
-                        HeaderConstants.X_ACCEL_BUFFERING: HeaderConstants.NO_BUFFERING
-                    }
+                    headers=_STREAM_RESPONSE_HEADERS
                 )
             except (UpstreamError, Exception) as e:
                 # 这里只处理流式响应启动前的异常（主要是连接错误）
@@ -528,22 +551,7 @@ class APIHandler:
                 self.token_manager.mark_token_success(token)
                 
                 # 处理工具调用
-                tool_calls = None
-                message_content = full_content
-                
-                if has_tools:
-                    tool_calls = self.tool_handler.extract_tool_invocations(full_content)
-                    if tool_calls:
-                        # 当存在工具调用时，内容必须为null（OpenAI规范）
-                        message_content = None
-                        safe_log_info(logger, LogMessages.TOOL_CALLS_EXTRACTED.format(
-                            json.dumps(tool_calls, ensure_ascii=False)
-                        ))
-                    else:
-                        # 从内容中移除工具JSON
-                        message_content = self.tool_handler.remove_tool_json_content(full_content)
-                        if not message_content:
-                            message_content = full_content  # 保留原内容如果清理后为空
+                tool_calls, message_content = await self._resolve_tool_content(full_content, has_tools)
                 
                 openai_response = self.response_processor.create_completion_response(
                     message_content, tool_calls, token_info, request.model
@@ -143,6 +143,18 @@ class NumericConstants:
     # chunk大小限制
     MIN_CHUNK_SIZE = 50
     
+    # 工具调用解析放到线程执行的内容长度阈值
+    TOOL_PARSE_OFFLOAD_THRESHOLD = 4096
+    
+    # token池统计信息缓存的最长有效期（秒）
+    TOKEN_STATS_CACHE_TTL = 1.0
+    
+    # token失效状态写入旁路文件的合并延迟（秒）
+    TOKEN_STATE_FLUSH_DELAY = 5.0
+    
+    # Token更新服务状态中文件存在性检查结果的缓存有效期（秒）
+    TOKEN_FILES_STATUS_CACHE_TTL = 1.0
+    
     # 内容预览长度
     CONTENT_PREVIEW_LENGTH = 200
     CONTENT_PREVIEW_SUFFIX = "..."
@@ -18,10 +18,20 @@ from src.constants import (
 )
 from src.exceptions import UpstreamError, TimeoutError as ProxyTimeoutError
 from src.tool_handler import ToolHandler
-from src.utils import safe_log_error, safe_log_info, safe_log_warning
+from src.utils import safe_log_error, safe_log_info, safe_log_warning, current_epoch
 
 logger = logging.getLogger(__name__)
 
+# 进程内共享的HTTP客户端，由ResponseProcessor.create_http_client延迟创建
+_http_client: Optional[httpx.AsyncClient] = None
+
+async def close_http_client() -> None:
+    """关闭共享的HTTP客户端（应用关闭时调用）"""
+    global _http_client
+    if _http_client is not None:
+        client, _http_client = _http_client, None
+        await client.aclose()
+
 class ResponseProcessor:
     """响应处理器"""
     
@@ -94,71 +104,84 @@ class ResponseProcessor:
         if dynamic_chunk_size > content_length:
             dynamic_chunk_size = min(self.config.STREAM_CHUNK_SIZE, content_length)
         
-        logger.debug(f"动态chunk_size计算: 内容长度={content_length}, 计算值={calculated_chunk_size}, 最终值={dynamic_chunk_size}")
+        logger.debug("动态chunk_size计算: 内容长度=%d, 计算值=%d, 最终值=%d", content_length, calculated_chunk_size, dynamic_chunk_size)
         
         return dynamic_chunk_size
     
     def content_to_multimodal(self, content) -> str | list[dict]:
         """将内容转换为多模态格式用于K2Think API"""
+        # 按精确类型判断：str和None直接返回，不经过额外的函数调用；子类等其他类型走兜底处理
+        content_type = type(content)
+        if content_type is str:
+            return content
         if content is None:
             return ""
-        if isinstance(content, str):
-            return content
-        if isinstance(content, list):
-            # 检查是否包含图像内容
-            has_image = False
-            result_parts = []
-            
-            for p in content:
-                if hasattr(p, 'type'):  # ContentPart object
-                    if getattr(p, 'type') == ContentConstants.TEXT_TYPE and getattr(p, 'text', None):
-                        result_parts.append({
-                            "type": ContentConstants.TEXT_TYPE,
-                            "text": getattr(p, 'text')
-                        })
-                    elif getattr(p, 'type') == ContentConstants.IMAGE_URL_TYPE and getattr(p, 'image_url', None):
-                        has_image = True
-                        image_url_obj = getattr(p, 'image_url')
-                        if hasattr(image_url_obj, 'url'):
-                            url = getattr(image_url_obj, 'url')
-                        else:
-                            url = image_url_obj.get('url') if isinstance(image_url_obj, dict) else str(image_url_obj)
-                        
-                        result_parts.append({
-                            "type": ContentConstants.IMAGE_URL_TYPE,
-                            "image_url": {
-                                "url": url
-                            }
-                        })
-                elif isinstance(p, dict):
-                    if p.get("type") == ContentConstants.TEXT_TYPE and p.get("text"):
-                        result_parts.append({
-                            "type": ContentConstants.TEXT_TYPE, 
-                            "text": p.get("text")
-                        })
-                    elif p.get("type") == ContentConstants.IMAGE_URL_TYPE and p.get("image_url"):
-                        has_image = True
-                        result_parts.append({
-                            "type": ContentConstants.IMAGE_URL_TYPE,
-                            "image_url": p.get("image_url")
-                        })
-                elif isinstance(p, str):
+        if content_type is list:
+            return self._list_to_multimodal(content)
+        return self._other_to_multimodal(content)
+    
+    def _list_to_multimodal(self, content: list) -> str | list[dict]:
+        """转换内容片段列表，包含图像时返回多模态格式，否则返回纯文本"""
+        # 检查是否包含图像内容
+        has_image = False
+        result_parts = []
+
+        for p in content:
+            if hasattr(p, 'type'):  # ContentPart object
+                if getattr(p, 'type') == ContentConstants.TEXT_TYPE and getattr(p, 'text', None):
                     result_parts.append({
                         "type": ContentConstants.TEXT_TYPE,
-                        "text": p
+                        "text": getattr(p, 'text')
                     })
-            
-            # 如果包含图像，返回多模态格式；否则返回纯文本
-            if has_image and result_parts:
-                return result_parts
-            else:
-                # 提取所有文本内容
-                text_parts = []
-                for part in result_parts:
-                    if part.get("type") == ContentConstants.TEXT_TYPE:
-                        text_parts.append(part.get("text", ""))
-                return " ".join(text_parts)
-        
+                elif getattr(p, 'type') == ContentConstants.IMAGE_URL_TYPE and getattr(p, 'image_url', None):
+                    has_image = True
+                    image_url_obj = getattr(p, 'image_url')
+                    if hasattr(image_url_obj, 'url'):
+                        url = getattr(image_url_obj, 'url')
+                    else:
+                        url = image_url_obj.get('url') if isinstance(image_url_obj, dict) else str(image_url_obj)
+
+                    result_parts.append({
+                        "type": ContentConstants.IMAGE_URL_TYPE,
+                        "image_url": {
+                            "url": url
+                        }
+                    })
+            elif isinstance(p, dict):
+                if p.get("type") == ContentConstants.TEXT_TYPE and p.get("text"):
+                    result_parts.append({
+                        "type": ContentConstants.TEXT_TYPE, 
+                        "text": p.get("text")
+                    })
+                elif p.get("type") == ContentConstants.IMAGE_URL_TYPE and p.get("image_url"):
+                    has_image = True
+                    result_parts.append({
+                        "type": ContentConstants.IMAGE_URL_TYPE,
+                        "image_url": p.get("image_url")
+                    })
+            elif isinstance(p, str):
+                result_parts.append({
+                    "type": ContentConstants.TEXT_TYPE,
+                    "text": p
+                })
+
+        # 如果包含图像，返回多模态格式；否则返回纯文本
+        if has_image and result_parts:
+            return result_parts
+        else:
+            # 提取所有文本内容
+            text_parts = []
+            for part in result_parts:
+                if part.get("type") == ContentConstants.TEXT_TYPE:
+                    text_parts.append(part.get("text", ""))
+            return " ".join(text_parts)
+    
+    def _other_to_multimodal(self, content) -> str | list[dict]:
+        """兜底转换：处理str/list子类及其他类型"""
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return self._list_to_multimodal(content)
         # 处理其他类型
         try:
             return str(content)
@@ -191,7 +214,11 @@ class ResponseProcessor:
         return str(uuid.uuid4())
     
     async def create_http_client(self) -> httpx.AsyncClient:
-        """创建HTTP客户端"""
+        """获取共享的HTTP客户端（首次调用时创建），复用连接池中的TCP/TLS连接"""
+        global _http_client
+        if _http_client is not None and not _http_client.is_closed:
+            return _http_client
+        
         base_kwargs = {
             "timeout": httpx.Timeout(timeout=None, connect=10.0),
             "limits": httpx.Limits(
@@ -202,7 +229,8 @@ class ResponseProcessor:
         }
         
         try:
-            return httpx.AsyncClient(**base_kwargs)
+            _http_client = httpx.AsyncClient(**base_kwargs)
+            return _http_client
         except Exception as e:
             safe_log_error(logger, "创建客户端失败", e)
             raise e
@@ -216,8 +244,6 @@ class ResponseProcessor:
         stream: bool = False
     ) -> httpx.Response:
         """发送HTTP请求"""
-        client = None
-        
         try:
             client = await self.create_http_client()
             
@@ -245,18 +271,12 @@ class ResponseProcessor:
                 
         except httpx.HTTPStatusError as e:
             safe_log_error(logger, f"HTTP状态错误: {e.response.status_code} - {e.response.text}")
-            if client and not stream:
-                await client.aclose()
             raise UpstreamError(f"上游服务错误: {e.response.status_code}", e.response.status_code)
         except httpx.TimeoutException as e:
             safe_log_error(logger, "请求超时", e)
-            if client and not stream:
-                await client.aclose()
             raise ProxyTimeoutError("请求超时")
         except Exception as e:
             safe_log_error(logger, "请求异常", e)
-            if client and not stream:
-                await client.aclose()
             raise e
     
     async def process_non_stream_response(self, k2think_payload: dict, headers: dict, output_thinking: bool = None) -> Tuple[str, dict]:
@@ -425,7 +445,7 @@ class ResponseProcessor:
         return {
             "id": f"chatcmpl-{int(time.time() * 1000)}",
             "object": ResponseConstants.CHAT_COMPLETION_CHUNK_OBJECT,
-            "created": int(time.time()),
+            "created": current_epoch(),
             "model": model or APIConstants.MODEL_ID,
             "choices": [{
                 "index": 0,
@@ -452,10 +472,11 @@ class ResponseProcessor:
         if tool_calls:
             message["tool_calls"] = tool_calls
         
+        created = current_epoch()
         return {
-            "id": f"chatcmpl-{int(time.time())}",
+            "id": f"chatcmpl-{created}",
             "object": ResponseConstants.CHAT_COMPLETION_OBJECT,
-            "created": int(time.time()),
+            "created": created,
             "model": model or APIConstants.MODEL_ID,
             "choices": [{
                 "index": 0,
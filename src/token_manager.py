@@ -3,15 +3,43 @@ Token管理模块
 负责管理K2Think的token池，实现轮询、负载均衡和失效标记
 """
 import os
+import re
 import json
+import hashlib
+import tempfile
+import itertools
 import logging
 import threading
+import time
+from array import array
+from collections import Counter
 
 from typing import List, Dict, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
+
+from src.constants import APIConstants, NumericConstants
 
 logger = logging.getLogger(__name__)
 
+def _parse_token_lines(text: str) -> List[str]:
+    """
+    从tokens文件内容中取出有效token：去掉首尾空白，跳过空行和以#开头的注释行
+    
+    与文本模式逐行读取后strip()的结果一致：\r、\n、\r\n都视为换行
+    """
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return [s for s in map(str.strip, text.split('\n')) if s and s[0] != '#']
+
+# last_used/last_failure数组中表示"从未发生"的值（monotonic时间不会为负）
+_NO_TIMESTAMP = -1.0
+
+# 失败次数数组（array('i')）能存放的最大值
+_MAX_FAILURE_COUNT = 2**31 - 1
+
+def _token_digest(token: str) -> str:
+    """token的SHA-256摘要，用作状态文件的键（不落盘原始token）"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
 # 导入安全日志函数
 try:
     from src.utils import safe_log_error, safe_log_info, safe_log_warning
@@ -41,6 +69,24 @@ except ImportError:
 class TokenManager:
     """Token管理器 - 支持轮询、负载均衡和失效标记"""
     
+    # 常见的上游服务错误标识，预编译为一个不区分大小写的正则
+    _UPSTREAM_ERROR_INDICATORS = (
+        "401",
+        "403",
+        "unauthorized",
+        "forbidden",
+        "invalid token",
+        "authentication failed",
+        "token expired",
+        "authentication error",
+        "invalid_request_error",
+        "authentication_error",
+    )
+    _UPSTREAM_ERROR_PATTERN = re.compile(
+        "|".join(re.escape(indicator) for indicator in _UPSTREAM_ERROR_INDICATORS),
+        re.IGNORECASE
+    )
+    
     def __init__(self, tokens_file: str = "tokens.txt", max_failures: int = 3, allow_empty: bool = False):
         """
         初始化token管理器
@@ -52,23 +98,54 @@ class TokenManager:
         """
         self.tokens_file = tokens_file
         self.max_failures = max_failures
-        self.tokens: List[Dict] = []
+        # token状态按列存储（SoA），同一位置即同一个token
+        self.tokens: List[str] = []
+        self._failures = array('i')
+        self._active = bytearray()
+        self._last_used = array('d')
+        self._last_failure = array('d')
+        self._by_token: Dict[str, int] = {}  # token -> 位置索引，用于O(1)查找
+        self._auth_headers: Dict[str, str] = {}  # token -> 预先格式化的Authorization头
+        self._cookie_headers: Dict[str, str] = {}  # token -> 预先格式化的Cookie头
         self.current_index = 0
         self.lock = threading.Lock()
+        # 轮询计数器与活跃token快照：读取方无需加锁，仅在状态变化时由持锁方整体替换
+        self._counter = itertools.count()
+        self._active_snapshot: Tuple[Tuple[int, str], ...] = ()  # (索引, token)
+        self._active_count = 0  # 活跃token数量，在状态变化时增减
+        
+        # get_token_stats结果缓存：状态变化时标记失效，并以TTL限制current_index等字段的滞后
+        self._stats_cache: Optional[Dict] = None
+        self._stats_dirty = True
+        self._stats_time = 0.0
+        
+        # last_used/last_failure以monotonic时间记录，输出时再换算为datetime
+        self._epoch_wallclock = time.time()
+        self._epoch_mono = time.monotonic()
         self.allow_empty = allow_empty
         
-        # 连续失效检测
+        # 连续失效检测（计数器使用独立的锁，不与token池状态竞争）
+        self._counter_lock = threading.Lock()
         self.consecutive_failures = 0
         self.consecutive_failure_threshold = 2  # 连续失效阈值
         self.force_refresh_callback = None  # 强制刷新回调函数
+        # 强制刷新在守护线程中执行（不阻塞进程退出），同一时间最多一个刷新任务
+        self._refresh_lock = threading.Lock()
+        self._refresh_inflight = False
         
         # 上游服务连续报错检测
         self.consecutive_upstream_errors = 0
         self.upstream_error_threshold = 2  # 上游服务连续报错阈值
         self.last_upstream_error_time = None
         
+        # token失效状态持久化到旁路文件，重启后不必再用线上请求重新发现失效token
+        self._state_file = f"{tokens_file}.state.json"
+        self._state_lock = threading.Lock()
+        self._state_flush_timer: Optional[threading.Timer] = None
+        
         # 加载tokens
         self.load_tokens()
+        self._restore_state()
         
         if not self.tokens and not allow_empty:
             raise ValueError(f"未找到有效的token，请检查文件: {tokens_file}")
@@ -79,24 +156,38 @@ class TokenManager:
             if not os.path.exists(self.tokens_file):
                 raise FileNotFoundError(f"Token文件不存在: {self.tokens_file}")
             
-            with open(self.tokens_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            with open(self.tokens_file, 'rb') as f:
+                data = f.read()
             
-            self.tokens = []
-            valid_token_index = 0
-            for line in lines:
-                token = line.strip()
-                # 忽略空行和注释行
-                if token and not token.startswith('#'):
-                    self.tokens.append({
-                        'token': token,
-                        'failures': 0,
-                        'is_active': True,
-                        'last_used': None,
-                        'last_failure': None,
-                        'index': valid_token_index
-                    })
-                    valid_token_index += 1
+            tokens = _parse_token_lines(data.decode('utf-8'))
+            by_token = {}
+            auth_headers = {}
+            cookie_headers = {}
+            for index, token in enumerate(tokens):
+                # 重复的token以第一次出现的为准
+                by_token.setdefault(token, index)
+                auth_headers[token] = f"{APIConstants.BEARER_PREFIX}{token}"
+                cookie_headers[token] = f"token={token}"
+            count = len(tokens)
+            
+            with self.lock:
+                self.tokens = tokens
+                self._failures = array('i', [0]) * count
+                self._active = bytearray(b'\x01' * count)
+                self._last_used = array('d', [_NO_TIMESTAMP]) * count
+                self._last_failure = array('d', [_NO_TIMESTAMP]) * count
+                self._by_token = by_token
+                self._auth_headers = auth_headers
+                self._cookie_headers = cookie_headers
+                self._counter = itertools.count()
+                self.current_index = 0
+                self._active_count = count
+                self._rebuild_active_snapshot()
+                self._stats_dirty = True
+            
+            # 重新加载后所有token状态已清零，同步覆盖旧的状态文件
+            if os.path.exists(self._state_file):
+                self._schedule_state_flush()
             
             safe_log_info(logger, f"成功加载 {len(self.tokens)} 个token")
             
@@ -112,38 +203,33 @@ class TokenManager:
         Returns:
             可用的token字符串，如果没有可用token则返回None
         """
-        with self.lock:
-            active_tokens = [t for t in self.tokens if t['is_active']]
-            
-            if not active_tokens:
-                if self.allow_empty:
-                    safe_log_warning(logger, "没有可用的token，可能正在等待自动更新")
-                else:
-                    safe_log_warning(logger, "没有可用的token")
-                return None
-            
-            # 轮询算法：从当前索引开始寻找下一个可用token
-            attempts = 0
-            while attempts < len(self.tokens):
-                token_info = self.tokens[self.current_index]
-                
-                if token_info['is_active']:
-                    # 更新使用时间
-                    token_info['last_used'] = datetime.now()
-                    token = token_info['token']
-                    
-                    # 移动到下一个索引
-                    self.current_index = (self.current_index + 1) % len(self.tokens)
-                    
-                    logger.debug(f"分配token (索引: {token_info['index']}, 失败次数: {token_info['failures']})")
-                    return token
-                
-                # 移动到下一个token
-                self.current_index = (self.current_index + 1) % len(self.tokens)
-                attempts += 1
-            
-            safe_log_warning(logger, "所有token都已失效")
+        # 只读取一次快照，整个过程不加锁
+        active_tokens = self._active_snapshot
+        
+        if not active_tokens:
+            if self.allow_empty:
+                logger.warning("没有可用的token，可能正在等待自动更新")
+            elif self.tokens:
+                logger.warning("所有token都已失效")
+            else:
+                logger.warning("没有可用的token")
             return None
+        
+        if len(active_tokens) == 1:
+            # 只有一个活跃token（常见的单账户部署）时直接返回，无需轮询计数
+            index, token = active_tokens[0]
+        else:
+            # 轮询算法：在活跃token快照上按计数器取模
+            index, token = active_tokens[next(self._counter) % len(active_tokens)]
+        
+        # 更新使用时间（并发重新加载时数组可能已被替换，越界则跳过）
+        last_used = self._last_used
+        if index < len(last_used):
+            last_used[index] = time.monotonic()
+        self.current_index = index + 1
+        
+        logger.debug("分配token (索引: %s)", index)
+        return token
     
     def mark_token_failure(self, token: str, error_message: str = "") -> bool:
         """
@@ -156,55 +242,63 @@ class TokenManager:
         Returns:
             如果token被标记为失效返回True，否则返回False
         """
+        # 检查是否是上游服务错误（401等认证错误），只读常量，无需持锁
+        is_upstream_error = self._is_upstream_error(error_message)
+        
         with self.lock:
-            for token_info in self.tokens:
-                if token_info['token'] == token:
-                    token_info['failures'] += 1
-                    token_info['last_failure'] = datetime.now()
-                    
-                    # 检查是否是上游服务错误（401等认证错误）
-                    is_upstream_error = self._is_upstream_error(error_message)
-                    
-                    if is_upstream_error:
-                        # 增加上游服务连续报错计数
-                        self.consecutive_upstream_errors += 1
-                        self.last_upstream_error_time = datetime.now()
-                        
-                        safe_log_warning(logger, f"🔒 上游服务认证错误 (索引: {token_info['index']}, "
-                                     f"失败次数: {token_info['failures']}/{self.max_failures}, "
-                                     f"连续上游错误: {self.consecutive_upstream_errors}): {error_message}")
-                        
-                        # 401错误立即触发强制刷新（不等连续错误阈值）
-                        if "401" in error_message and self.force_refresh_callback:
-                            safe_log_warning(logger, f"🚨 检测到401认证错误，立即触发token强制刷新")
-                            self._trigger_force_refresh("401认证失败")
-                            # 重置连续计数，避免重复触发
-                            self.consecutive_upstream_errors = 0
-                        else:
-                            # 其他上游错误按原逻辑处理
-                            self._check_consecutive_upstream_errors()
-                    else:
-                        # 增加连续失效计数
-                        self.consecutive_failures += 1
-                        
-                        safe_log_warning(logger, f"Token失败 (索引: {token_info['index']}, "
-                                     f"失败次数: {token_info['failures']}/{self.max_failures}, "
-                                     f"连续失效: {self.consecutive_failures}): {error_message}")
-                        
-                        # 检查连续失效触发条件
-                        self._check_consecutive_failures()
-                    
-                    # 检查是否达到最大失败次数
-                    if token_info['failures'] >= self.max_failures:
-                        token_info['is_active'] = False
-                        safe_log_error(logger, f"Token已失效 (索引: {token_info['index']}, "
-                                   f"失败次数: {token_info['failures']})")
-                        return True
-                    
-                    return False
+            index = self._by_token.get(token)
+            if index is None:
+                logger.warning("未找到匹配的token进行失败标记")
+                return False
+            
+            self._failures[index] += 1
+            self._last_failure[index] = time.monotonic()
+            failures = self._failures[index]
+            self._stats_dirty = True
             
-            safe_log_warning(logger, "未找到匹配的token进行失败标记")
-            return False
+            # 检查是否达到最大失败次数
+            deactivated = failures >= self.max_failures
+            if deactivated and self._active[index]:
+                self._active[index] = 0
+                self._active_count -= 1
+                self._rebuild_active_snapshot()
+        
+        self._schedule_state_flush()
+        
+        # 连续失效/上游错误计数与token池状态无关，使用独立的锁
+        with self._counter_lock:
+            if is_upstream_error:
+                # 增加上游服务连续报错计数
+                self.consecutive_upstream_errors += 1
+                self.last_upstream_error_time = datetime.now()
+                
+                logger.warning("🔒 上游服务认证错误 (索引: %d, 失败次数: %d/%d, 连续上游错误: %d): %s",
+                               index, failures, self.max_failures, self.consecutive_upstream_errors, error_message)
+                
+                # 401错误立即触发强制刷新（不等连续错误阈值）
+                if "401" in error_message and self.force_refresh_callback:
+                    logger.warning("🚨 检测到401认证错误，立即触发token强制刷新")
+                    self._trigger_force_refresh("401认证失败")
+                    # 重置连续计数，避免重复触发
+                    self.consecutive_upstream_errors = 0
+                else:
+                    # 其他上游错误按原逻辑处理
+                    self._check_consecutive_upstream_errors()
+            else:
+                # 增加连续失效计数
+                self.consecutive_failures += 1
+                
+                logger.warning("Token失败 (索引: %d, 失败次数: %d/%d, 连续失效: %d): %s",
+                               index, failures, self.max_failures, self.consecutive_failures, error_message)
+                
+                # 检查连续失效触发条件
+                self._check_consecutive_failures()
+        
+        if deactivated:
+            logger.error("Token已失效 (索引: %d, 失败次数: %d)", index, failures)
+            return True
+        
+        return False
     
     def mark_token_success(self, token: str) -> None:
         """
@@ -213,21 +307,29 @@ class TokenManager:
         Args:
             token: 成功的token
         """
+        recovered = False
         with self.lock:
-            for token_info in self.tokens:
-                if token_info['token'] == token:
-                    if token_info['failures'] > 0:
-                        safe_log_info(logger, f"Token恢复 (索引: {token_info['index']}, "
-                                  f"重置失败次数: {token_info['failures']} -> 0)")
-                        token_info['failures'] = 0
-                    
-                    # 成功请求重置上游服务错误计数
-                    if self.consecutive_upstream_errors > 0:
-                        safe_log_info(logger, f"重置上游服务连续错误计数: {self.consecutive_upstream_errors} -> 0")
-                        self.consecutive_upstream_errors = 0
-                    
-                    # 注意：不再自动重置连续失效计数，只有手动重置或强制刷新成功后才重置
-                    return
+            index = self._by_token.get(token)
+            if index is None:
+                return
+            
+            if self._failures[index] > 0:
+                logger.info("Token恢复 (索引: %d, 重置失败次数: %d -> 0)", index, self._failures[index])
+                self._failures[index] = 0
+                self._stats_dirty = True
+                recovered = True
+        
+        if recovered:
+            self._schedule_state_flush()
+        
+        # 成功请求重置上游服务错误计数（计数为0时无需加锁）
+        if self.consecutive_upstream_errors > 0:
+            with self._counter_lock:
+                if self.consecutive_upstream_errors > 0:
+                    logger.info("重置上游服务连续错误计数: %d -> 0", self.consecutive_upstream_errors)
+                    self.consecutive_upstream_errors = 0
+        
+        # 注意：不再自动重置连续失效计数，只有手动重置或强制刷新成功后才重置
     
     def get_token_stats(self) -> Dict:
         """
@@ -237,23 +339,28 @@ class TokenManager:
             包含统计信息的字典
         """
         with self.lock:
-            total = len(self.tokens)
-            active = sum(1 for t in self.tokens if t['is_active'])
-            inactive = total - active
-            
-            failure_distribution = {}
-            for token_info in self.tokens:
-                failures = token_info['failures']
-                failure_distribution[failures] = failure_distribution.get(failures, 0) + 1
+            now = time.monotonic()
+            if (self._stats_dirty or self._stats_cache is None
+                    or now - self._stats_time >= NumericConstants.TOKEN_STATS_CACHE_TTL):
+                total = len(self.tokens)
+                active = self._active_count
+                inactive = total - active
+                
+                failure_distribution = dict(Counter(self._failures))
+                
+                self._stats_cache = {
+                    'total_tokens': total,
+                    'active_tokens': active,
+                    'inactive_tokens': inactive,
+                    'current_index': self.current_index % total if total else 0,
+                    'failure_distribution': failure_distribution,
+                    'max_failures': self.max_failures
+                }
+                self._stats_dirty = False
+                self._stats_time = now
             
-            return {
-                'total_tokens': total,
-                'active_tokens': active,
-                'inactive_tokens': inactive,
-                'current_index': self.current_index,
-                'failure_distribution': failure_distribution,
-                'max_failures': self.max_failures
-            }
+            # 返回副本，调用方可能会往结果中追加字段
+            return dict(self._stats_cache)
     
     def reset_token(self, token_index: int) -> bool:
         """
@@ -267,34 +374,46 @@ class TokenManager:
         """
         with self.lock:
             if 0 <= token_index < len(self.tokens):
-                token_info = self.tokens[token_index]
-                old_failures = token_info['failures']
-                old_active = token_info['is_active']
+                old_failures = self._failures[token_index]
+                old_active = bool(self._active[token_index])
                 
-                token_info['failures'] = 0
-                token_info['is_active'] = True
-                token_info['last_failure'] = None
+                self._failures[token_index] = 0
+                self._active[token_index] = 1
+                self._last_failure[token_index] = _NO_TIMESTAMP
+                self._stats_dirty = True
+                if not old_active:
+                    self._active_count += 1
+                    self._rebuild_active_snapshot()
                 
                 safe_log_info(logger, f"Token重置 (索引: {token_index}, "
                            f"失败次数: {old_failures} -> 0, "
                            f"状态: {old_active} -> True)")
-                return True
-            
-            safe_log_warning(logger, f"无效的token索引: {token_index}")
-            return False
+            else:
+                safe_log_warning(logger, f"无效的token索引: {token_index}")
+                return False
+        
+        self._schedule_state_flush()
+        return True
     
     def reset_all_tokens(self) -> None:
         """重置所有token（清除所有失败计数，重新激活所有token）"""
         with self.lock:
             reset_count = 0
-            for token_info in self.tokens:
-                if token_info['failures'] > 0 or not token_info['is_active']:
-                    token_info['failures'] = 0
-                    token_info['is_active'] = True
-                    token_info['last_failure'] = None
+            for index in range(len(self.tokens)):
+                if self._failures[index] > 0 or not self._active[index]:
+                    self._failures[index] = 0
+                    self._active[index] = 1
+                    self._last_failure[index] = _NO_TIMESTAMP
                     reset_count += 1
+            if self._active_count != len(self.tokens):
+                self._active_count = len(self.tokens)
+                self._rebuild_active_snapshot()
+            self._stats_dirty = True
             
             safe_log_info(logger, f"重置了 {reset_count} 个token，当前活跃token数: {len(self.tokens)}")
+        
+        if reset_count:
+            self._schedule_state_flush()
     
     def reload_tokens(self) -> None:
         """重新加载token文件"""
@@ -305,12 +424,159 @@ class TokenManager:
         
         safe_log_info(logger, f"Token重新加载完成: {old_count} -> {new_count}")
     
+    def _restore_state(self) -> None:
+        """启动时从状态文件恢复token的失败次数和失效状态"""
+        try:
+            with open(self._state_file, 'r', encoding='utf-8') as f:
+                saved_state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            safe_log_warning(logger, f"读取token状态文件失败: {e}")
+            return
+        
+        if not isinstance(saved_state, dict):
+            safe_log_warning(logger, f"token状态文件格式无效，已忽略: {self._state_file}")
+            return
+        
+        # 先完整校验并解析，任何一项无效都整体忽略状态文件，不会部分应用
+        restored = []
+        try:
+            for index, token in enumerate(self.tokens):
+                entry = saved_state.get(_token_digest(token))
+                if not entry:
+                    continue
+                if not isinstance(entry, dict):
+                    raise TypeError(f"无效的状态条目: {entry!r}")
+                failures = int(entry.get('failures', 0))
+                if not 0 <= failures <= _MAX_FAILURE_COUNT:
+                    raise ValueError(f"失败次数超出范围: {failures}")
+                restored.append((index, failures, bool(entry.get('is_active', True))))
+        except (TypeError, ValueError) as e:
+            safe_log_warning(logger, f"token状态文件内容无效，已忽略: {e}")
+            return
+        
+        restored_count = len(restored)
+        with self.lock:
+            for index, failures, is_active in restored:
+                self._failures[index] = failures
+                if not is_active and self._active[index]:
+                    self._active[index] = 0
+                    self._active_count -= 1
+            
+            if restored_count:
+                self._rebuild_active_snapshot()
+                self._stats_dirty = True
+        
+        if restored_count:
+            safe_log_info(logger, f"已从状态文件恢复 {restored_count} 个token的失败状态")
+    
+    def _schedule_state_flush(self) -> None:
+        """延迟写入状态文件，合并一段时间内的多次状态变化"""
+        with self._state_lock:
+            if self._state_flush_timer is not None:
+                return
+            timer = threading.Timer(NumericConstants.TOKEN_STATE_FLUSH_DELAY, self._flush_state)
+            timer.daemon = True
+            self._state_flush_timer = timer
+        timer.start()
+    
+    def _flush_state(self) -> None:
+        """将有失败记录或已失效的token状态写入状态文件（原子性替换）"""
+        with self._state_lock:
+            self._state_flush_timer = None
+        
+        with self.lock:
+            pending = [
+                (token, self._failures[index], bool(self._active[index]))
+                for index, token in enumerate(self.tokens)
+                if self._failures[index] or not self._active[index]
+            ]
+        
+        state = {
+            _token_digest(token): {'failures': failures, 'is_active': is_active}
+            for token, failures, is_active in pending
+        }
+        
+        temp_path = None
+        try:
+            state_dir = os.path.dirname(self._state_file) or "."
+            fd, temp_path = tempfile.mkstemp(dir=state_dir, prefix=".token-state-", suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self._state_file)
+        except Exception as e:
+            safe_log_warning(logger, f"写入token状态文件失败: {e}")
+            if temp_path and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+    
+    def _rebuild_active_snapshot(self) -> None:
+        """重建活跃token快照（调用方需持有锁）"""
+        self._active_snapshot = tuple(
+            (index, token) for index, token in enumerate(self.tokens) if self._active[index]
+        )
+    
     def get_token_by_index(self, index: int) -> Optional[Dict]:
         """根据索引获取token信息"""
         with self.lock:
-            if 0 <= index < len(self.tokens):
-                return self.tokens[index].copy()
+            if not 0 <= index < len(self.tokens):
+                return None
+            token = self.tokens[index]
+            failures = self._failures[index]
+            is_active = bool(self._active[index])
+            last_used = self._last_used[index]
+            last_failure = self._last_failure[index]
+        
+        # 按需还原为原有的字典结构，保持接口兼容
+        return {
+            'token': token,
+            'failures': failures,
+            'is_active': is_active,
+            'last_used': self._mono_to_datetime(last_used),
+            'last_failure': self._mono_to_datetime(last_failure),
+            'index': index
+        }
+    
+    def _mono_to_datetime(self, mono: float) -> Optional[datetime]:
+        """将monotonic时间换算为本地datetime"""
+        if mono == _NO_TIMESTAMP:
             return None
+        return datetime.fromtimestamp(self._epoch_wallclock + (mono - self._epoch_mono))
+    
+    def get_auth_header(self, token: str) -> str:
+        """
+        获取token对应的Authorization头值
+        
+        头字符串在加载token时预先格式化，轮询到同一token时直接复用
+        
+        Args:
+            token: token字符串
+            
+        Returns:
+            "Bearer <token>" 格式的头值
+        """
+        header = self._auth_headers.get(token)
+        if header is None:
+            header = f"{APIConstants.BEARER_PREFIX}{token}"
+        return header
+    
+    def get_cookie_header(self, token: str) -> str:
+        """
+        获取token对应的Cookie头值
+        
+        Args:
+            token: token字符串
+            
+        Returns:
+            "token=<token>" 格式的头值
+        """
+        header = self._cookie_headers.get(token)
+        if header is None:
+            header = f"token={token}"
+        return header
     
     def set_force_refresh_callback(self, callback):
         """
@@ -332,34 +598,11 @@ class TokenManager:
         Returns:
             如果是上游服务错误返回True，否则返回False
         """
-        # 检查常见的上游服务错误标识
-        upstream_error_indicators = [
-            "上游服务错误: 401",
-            "上游服务错误: 403", 
-            "401",
-            "403",
-            "unauthorized", 
-            "forbidden",
-            "invalid token",
-            "authentication failed",
-            "token expired",
-            "authentication error",
-            "invalid_request_error",
-            "authentication_error"
-        ]
-        
-        error_lower = error_message.lower()
-        is_upstream = any(indicator.lower() in error_lower for indicator in upstream_error_indicators)
-        
-        # 特别检查HTTP状态码模式
-        import re
-        # 匹配 "上游服务错误: xxx" 或 "HTTP状态错误: xxx" 等格式中的401/403
-        status_code_pattern = r'(?:上游服务错误|http状态错误|状态码):\s*(?:40[13])'
-        if re.search(status_code_pattern, error_lower):
-            is_upstream = True
+        # 单次正则匹配所有上游服务错误标识（含 "上游服务错误: 401" 等状态码格式）
+        is_upstream = self._UPSTREAM_ERROR_PATTERN.search(error_message) is not None
         
         if is_upstream:
-            safe_log_info(logger, f"检测到上游服务认证错误: {error_message}")
+            logger.info("检测到上游服务认证错误: %s", error_message)
         
         return is_upstream
     
@@ -368,7 +611,7 @@ class TokenManager:
         检查上游服务连续报错情况，触发强制刷新机制
         """
         if self.consecutive_upstream_errors >= self.upstream_error_threshold:
-            safe_log_warning(logger, f"🚨 检测到连续{self.consecutive_upstream_errors}个上游服务认证错误（401/403），触发自动刷新token池")
+            logger.warning("🚨 检测到连续%d个上游服务认证错误（401/403），触发自动刷新token池", self.consecutive_upstream_errors)
             
             # 重置上游错误计数，避免重复触发
             self.consecutive_upstream_errors = 0
@@ -376,7 +619,7 @@ class TokenManager:
             if self.force_refresh_callback:
                 self._trigger_force_refresh("上游服务连续认证失败 (401/403)")
             else:
-                safe_log_warning(logger, "⚠️ 未设置强制刷新回调函数，无法自动刷新token池")
+                logger.warning("⚠️ 未设置强制刷新回调函数，无法自动刷新token池")
     
     def _check_consecutive_failures(self):
         """
@@ -384,16 +627,16 @@ class TokenManager:
         """
         # 只有在token池数量大于2时才检查连续失效
         if len(self.tokens) <= 2:
-            logger.debug(f"Token池数量({len(self.tokens)})不足，跳过连续失效检查")
+            logger.debug("Token池数量(%d)不足，跳过连续失效检查", len(self.tokens))
             return
         
         if self.consecutive_failures >= self.consecutive_failure_threshold:
-            safe_log_warning(logger, f"检测到连续{self.consecutive_failures}个token失效，触发强制刷新机制")
+            logger.warning("检测到连续%d个token失效，触发强制刷新机制", self.consecutive_failures)
             
             if self.force_refresh_callback:
                 self._trigger_force_refresh("连续token失效")
             else:
-                safe_log_warning(logger, "未设置强制刷新回调函数，无法自动刷新token池")
+                logger.warning("未设置强制刷新回调函数，无法自动刷新token池")
     
     def _trigger_force_refresh(self, reason: str):
         """
@@ -402,34 +645,32 @@ class TokenManager:
         Args:
             reason: 触发原因
         """
+        with self._refresh_lock:
+            if self._refresh_inflight:
+                logger.info("强制刷新已在进行中，忽略本次触发 - 原因: %s", reason)
+                return
+            self._refresh_inflight = True
+        
         try:
-            # 异步调用强制刷新
-            import asyncio
-            import threading
-            
-            def run_async_callback():
-                try:
-                    # 创建新的事件循环（如果当前线程没有）
-                    try:
-                        loop = asyncio.get_event_loop()
-                    except RuntimeError:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                    
-                    # 运行强制刷新（现在是同步函数）
-                    self.force_refresh_callback()
-                    
-                    safe_log_info(logger, f"🔄 强制刷新tokens.txt已触发 - 原因: {reason}")
-                    
-                except Exception as e:
-                    safe_log_error(logger, "执行强制刷新回调失败", e)
-            
-            # 在新线程中执行，避免阻塞当前操作
-            refresh_thread = threading.Thread(target=run_async_callback, daemon=True)
-            refresh_thread.start()
-            
+            # 在后台守护线程中执行，避免阻塞当前操作
+            threading.Thread(
+                target=self._run_force_refresh, args=(reason,), name="token-refresh", daemon=True
+            ).start()
+        except Exception as e:
+            with self._refresh_lock:
+                self._refresh_inflight = False
+            safe_log_error(logger, "提交强制刷新任务失败", e)
+    
+    def _run_force_refresh(self, reason: str):
+        """在后台线程中运行强制刷新回调（回调为同步函数）"""
+        try:
+            self.force_refresh_callback()
+            safe_log_info(logger, f"🔄 强制刷新tokens.txt已触发 - 原因: {reason}")
         except Exception as e:
-            safe_log_error(logger, "启动强制刷新线程失败", e)
+            safe_log_error(logger, "执行强制刷新回调失败", e)
+        finally:
+            with self._refresh_lock:
+                self._refresh_inflight = False
     
     def get_consecutive_failures(self) -> int:
         """获取当前连续失效次数"""
@@ -441,7 +682,7 @@ class TokenManager:
     
     def reset_consecutive_failures(self):
         """重置连续失效计数"""
-        with self.lock:
+        with self._counter_lock:
             old_count = self.consecutive_failures
             old_upstream_count = self.consecutive_upstream_errors
             
@@ -1,17 +1,19 @@
 # -*- coding: utf-8 -*-
 """
 Token更新服务模块
-定期运行get_tokens.py来更新token池
+定期在进程内调用get_tokens.py来更新token池
 """
 import os
 import time
+import asyncio
 import logging
 import threading
-import subprocess
+import importlib.util
 import shutil
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from typing import Optional
 from datetime import datetime, timedelta
-from src.utils import safe_log_error, safe_log_info, safe_log_warning
+from src.constants import NumericConstants
 # 移除循环导入，Config在需要时动态导入
 
 logger = logging.getLogger(__name__)
@@ -38,35 +40,89 @@ class TokenUpdater:
         self.accounts_file = accounts_file
         self.tokens_file = tokens_file
         
-        self.is_running = False
+        # 置位表示服务未运行：start()时清除，stop()时置位并立即唤醒等待中的更新循环
+        self._stop_event = threading.Event()
+        self._stop_event.set()
         self.update_thread: Optional[threading.Thread] = None
         self.last_update: Optional[datetime] = None
+        # last_update及下次更新时间的ISO字符串，只在last_update变化时格式化
+        self._last_update_iso: Optional[str] = None
+        self._next_update_iso: Optional[str] = None
         self.update_count = 0
         self.error_count = 0
         self.is_updating = False
         self.last_error: Optional[str] = None
+        # 文件存在性检查结果缓存，供频繁调用的get_status复用
+        self._files_status: dict = {}
+        self._files_status_time = float("-inf")
         
-        safe_log_info(logger, f"Token更新器初始化完成 - 更新间隔: {update_interval}秒")
+        # get_tokens模块及其提取器在首次更新时加载，之后复用（共享同一个HTTP Session）
+        self._get_tokens_module = None
+        self._token_extractor = None
+        # 当前更新任务的工作线程（守护线程，不阻塞进程退出）及其取消事件
+        self._update_worker: Optional[threading.Thread] = None
+        self._update_cancel: Optional[threading.Event] = None
+        
+        logger.info("Token更新器初始化完成 - 更新间隔: %s秒", update_interval)
         
         # 清理可能遗留的临时文件
         self.cleanup_all_temp_files()
     
+    @property
+    def is_running(self) -> bool:
+        """更新服务是否在运行（由停止事件推导）"""
+        return not self._stop_event.is_set()
+    
+    def _files_present(self, max_age: float = 0.0) -> dict:
+        """
+        检查脚本、账户文件和tokens文件是否存在
+        
+        结果在max_age秒内直接复用，避免频繁调用的get_status每次都访问文件系统
+        """
+        now = time.monotonic()
+        if now - self._files_status_time < max_age:
+            return self._files_status
+        
+        status = {
+            "get_tokens_script": os.path.exists(self.get_tokens_script),
+            "accounts_file": os.path.exists(self.accounts_file),
+            "tokens_file": os.path.exists(self.tokens_file),
+        }
+        self._files_status = status
+        self._files_status_time = now
+        return status
+    
     def _check_files_exist(self) -> bool:
         """检查必要文件是否存在"""
-        if not os.path.exists(self.get_tokens_script):
-            safe_log_error(logger, f"get_tokens.py脚本不存在: {self.get_tokens_script}")
+        files = self._files_present()
+        if not files["get_tokens_script"]:
+            logger.error("get_tokens.py脚本不存在: %s", self.get_tokens_script)
             return False
         
-        if not os.path.exists(self.accounts_file):
-            safe_log_error(logger, f"账户文件不存在: {self.accounts_file}")
+        if not files["accounts_file"]:
+            logger.error("账户文件不存在: %s", self.accounts_file)
             return False
         
         return True
     
+    def _load_get_tokens(self):
+        """加载get_tokens脚本模块（按配置的脚本路径，进程内只加载一次）"""
+        if self._get_tokens_module is None:
+            spec = importlib.util.spec_from_file_location("get_tokens", self.get_tokens_script)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)  # get_tokens在导入时没有进程级副作用
+            self._token_extractor = module.K2ThinkTokenExtractor()
+            self._get_tokens_module = module
+        return self._get_tokens_module, self._token_extractor
+    
     def _run_token_update(self) -> bool:
         """运行token更新脚本（原子性更新）"""
         if self.is_updating:
-            safe_log_warning(logger, "Token更新已在进行中，跳过此次更新")
+            logger.warning("Token更新已在进行中，跳过此次更新")
+            return False
+        if self._update_worker is not None and self._update_worker.is_alive():
+            # 超时或停止后被取消的更新仍在结束进行中的登录请求，避免与其争用临时文件
+            logger.warning("上一次被取消的Token更新尚未结束，跳过此次更新")
             return False
             
         self.is_updating = True
@@ -74,46 +130,34 @@ class TokenUpdater:
         temp_tokens_file = f"{self.tokens_file}.tmp"
         
         try:
-            safe_log_info(logger, "开始更新token池...")
+            logger.info("开始更新token池...")
             
             # 使用临时文件进行更新，避免服务中断
-            result = subprocess.run(
-                ["python", self.get_tokens_script, self.accounts_file, temp_tokens_file],
-                capture_output=True,
-                encoding='utf-8', 
-                text=True,
-                timeout=300  # 5分钟超时
-            )
+            get_tokens, extractor = self._load_get_tokens()
+            future = self._start_update_worker(get_tokens, extractor, temp_tokens_file)
+            try:
+                success = future.result(timeout=300)  # 5分钟超时
+            except FutureTimeoutError:
+                # 通知工作线程不再发起新的登录，也不再写入临时文件
+                self._update_cancel.set()
+                raise
             
-            if result.returncode == 0:
+            if success:
                 # 检查临时文件是否生成且不为空
                 if os.path.exists(temp_tokens_file) and os.path.getsize(temp_tokens_file) > 0:
                     try:
-                        # 原子性替换：避免重命名正在使用的文件
                         if os.path.exists(self.tokens_file):
-                            # 备份当前文件（使用复制而非重命名，避免文件锁定问题）
                             backup_file = f"{self.tokens_file}.backup"
-                            if os.path.exists(backup_file):
-                                os.remove(backup_file)  # 删除旧备份
-                            
-                            # 复制当前文件到备份位置
-                            shutil.copy2(self.tokens_file, backup_file)
-                            logger.debug(f"已备份当前tokens文件到: {backup_file}")
+                            self._backup_tokens_file(backup_file)
+                            logger.debug("已备份当前tokens文件到: %s", backup_file)
                         
-                        # 使用临时文件替换原文件（Windows下更安全的方式）
-                        if os.name == 'nt':  # Windows系统
-                            # 在Windows下，先删除目标文件再重命名
-                            if os.path.exists(self.tokens_file):
-                                os.remove(self.tokens_file)
-                            os.rename(temp_tokens_file, self.tokens_file)
-                        else:
-                            # Unix/Linux系统可以直接重命名覆盖
-                            os.rename(temp_tokens_file, self.tokens_file)
+                        # os.replace在各平台上都会原子性覆盖目标文件
+                        os.replace(temp_tokens_file, self.tokens_file)
                         
-                        safe_log_info(logger, "Token更新成功，文件已原子性替换")
-                        logger.debug(f"更新输出: {result.stdout}")
+                        logger.info("Token更新成功，文件已原子性替换")
                         self.update_count += 1
-                        self.last_update = datetime.now()
+                        self._set_last_update(datetime.now())
+                        self._files_status_time = float("-inf")  # tokens文件刚被替换，状态缓存作废
                         
                         # 通知需要重新加载token管理器
                         self._notify_token_reload()
@@ -121,36 +165,36 @@ class TokenUpdater:
                         return True
                     except Exception as rename_error:
                         error_msg = f"文件重命名失败: {rename_error}"
-                        safe_log_error(logger, error_msg)
+                        logger.error(error_msg)
                         self.last_error = error_msg
                         self._cleanup_temp_file(temp_tokens_file)
                         self.error_count += 1
                         return False
                 else:
                     error_msg = "Token更新失败 - 临时文件为空或不存在"
-                    safe_log_error(logger, error_msg)
+                    logger.error(error_msg)
                     self.last_error = error_msg
                     self._cleanup_temp_file(temp_tokens_file)
                     self.error_count += 1
                     return False
             else:
-                error_msg = f"Token更新失败 - 返回码: {result.returncode}, 错误: {result.stderr}"
-                safe_log_error(logger, error_msg)
+                error_msg = "Token更新失败 - 未获取到任何token"
+                logger.error(error_msg)
                 self.last_error = error_msg
                 self._cleanup_temp_file(temp_tokens_file)
                 self.error_count += 1
                 return False
                 
-        except subprocess.TimeoutExpired:
+        except FutureTimeoutError:
             error_msg = "Token更新超时"
-            safe_log_error(logger, error_msg)
+            logger.error(error_msg)
             self.last_error = error_msg
             self._cleanup_temp_file(temp_tokens_file)
             self.error_count += 1
             return False
         except Exception as e:
             error_msg = f"Token更新异常: {e}"
-            safe_log_error(logger, error_msg)
+            logger.error(error_msg)
             self.last_error = error_msg
             self._cleanup_temp_file(temp_tokens_file)
             self.error_count += 1
@@ -158,6 +202,48 @@ class TokenUpdater:
         finally:
             self.is_updating = False
     
+    def _start_update_worker(self, get_tokens, extractor, temp_tokens_file: str) -> Future:
+        """在守护线程中运行generate_tokens，返回可带超时等待的Future"""
+        future = Future()
+        cancel_event = threading.Event()
+        
+        def run():
+            try:
+                future.set_result(get_tokens.generate_tokens(
+                    self.accounts_file, temp_tokens_file, extractor, cancel_event
+                ))
+            except Exception as e:
+                future.set_exception(e)
+        
+        self._update_cancel = cancel_event
+        self._update_worker = threading.Thread(target=run, name="token-update", daemon=True)
+        self._update_worker.start()
+        return future
+    
+    def _backup_tokens_file(self, backup_file: str):
+        """
+        备份当前tokens文件
+        
+        优先创建硬链接（只改元数据，不复制内容）；随后的os.replace会让tokens文件指向新inode，
+        备份仍保留旧内容。文件系统不支持硬链接时退回到复制。
+        """
+        link_file = f"{backup_file}.link"
+        try:
+            if os.path.exists(link_file):
+                os.remove(link_file)
+            os.link(self.tokens_file, link_file)
+            # 先链接到临时名再替换，旧备份会被原子性覆盖
+            os.replace(link_file, backup_file)
+        except OSError:
+            self._cleanup_temp_file(link_file)
+            shutil.copy2(self.tokens_file, backup_file)
+    
+    def _set_last_update(self, last_update: datetime):
+        """记录最近一次更新时间，并缓存状态接口使用的ISO字符串"""
+        self.last_update = last_update
+        self._last_update_iso = last_update.isoformat()
+        self._next_update_iso = (last_update + timedelta(seconds=self.update_interval)).isoformat()
+    
     def _cleanup_temp_file(self, temp_file: str):
         """清理临时文件"""
         try:
@@ -165,13 +251,14 @@ class TokenUpdater:
                 os.remove(temp_file)
                 logger.debug(f"已清理临时文件: {temp_file}")
         except Exception as e:
-            safe_log_warning(logger, f"清理临时文件失败: {e}")
+            logger.warning("清理临时文件失败: %s", e)
     
     def cleanup_all_temp_files(self):
         """清理所有相关的临时文件"""
         temp_patterns = [
             f"{self.tokens_file}.tmp",
-            f"{self.tokens_file}.backup"
+            f"{self.tokens_file}.backup",
+            f"{self.tokens_file}.backup.link"
         ]
         
         cleaned_count = 0
@@ -179,13 +266,13 @@ class TokenUpdater:
             try:
                 if os.path.exists(pattern):
                     os.remove(pattern)
-                    safe_log_info(logger, f"已清理遗留文件: {pattern}")
+                    logger.info("已清理遗留文件: %s", pattern)
                     cleaned_count += 1
             except Exception as e:
-                safe_log_warning(logger, f"清理遗留文件失败 {pattern}: {e}")
+                logger.warning("清理遗留文件失败 %s: %s", pattern, e)
         
         if cleaned_count > 0:
-            safe_log_info(logger, f"共清理了 {cleaned_count} 个遗留文件")
+            logger.info("共清理了 %d 个遗留文件", cleaned_count)
         else:
             logger.debug("没有发现需要清理的遗留文件")
         
@@ -195,101 +282,98 @@ class TokenUpdater:
         """通知需要重新加载token管理器"""
         try:
             # 导入Config来触发token重新加载
-            from src.config import Config
-            if Config._token_manager is not None:
-                Config._token_manager.reload_tokens()
-                safe_log_info(logger, "Token管理器已重新加载")
+            from src.config import CONFIG
+            if CONFIG._token_manager is not None:
+                CONFIG._token_manager.reload_tokens()
+                logger.info("Token管理器已重新加载")
         except Exception as e:
-            safe_log_warning(logger, f"通知token重新加载失败: {e}")
+            logger.warning("通知token重新加载失败: %s", e)
     
 
     def _update_loop(self):
         """更新循环"""
-        safe_log_info(logger, "Token更新服务启动")
+        logger.info("Token更新服务启动")
         
         # # 首次启动时，如果tokens.txt中没有token（非#开头），立即更新一次
         # 判断tokens.txt中的token数量
         if os.path.exists(self.tokens_file):
             try:
-                # 读取文件内容并立即关闭文件句柄
+                # 逐行扫描，读到第一个有效token即停止，文件句柄在更新前关闭
                 with open(self.tokens_file, "r", encoding="utf-8") as f:
-                    content = f.read()
-                
-                # 在文件句柄关闭后处理内容
-                lines = content.splitlines()
-                valid_lines = [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+                    has_token = any(s and s[0] != "#" for s in map(str.strip, f))
                 
-                if len(valid_lines) < 1:
+                if not has_token:
                     # 动态导入Config避免循环导入
-                    from src.config import Config
-                    if Config.ENABLE_TOKEN_AUTO_UPDATE:
-                        safe_log_info(logger, "首次启动时，tokens.txt中没有token（非#开头），立即更新一次")
+                    from src.config import CONFIG
+                    if CONFIG.ENABLE_TOKEN_AUTO_UPDATE:
+                        logger.info("首次启动时，tokens.txt中没有token（非#开头），立即更新一次")
                         # 添加小延迟确保文件句柄完全释放
                         
                         time.sleep(0.1)
                         self._run_token_update()
             except Exception as e:
-                safe_log_warning(logger, f"检查tokens文件时出错: {e}")
+                logger.warning("检查tokens文件时出错: %s", e)
         
-        while self.is_running:
+        while not self._stop_event.is_set():
             try:
-                time.sleep(self.update_interval)
-                
-                if not self.is_running:
+                if self._stop_event.wait(self.update_interval):
                     break
                 
                 if self._check_files_exist():
                     self._run_token_update()
                 else:
-                    safe_log_warning(logger, "跳过此次更新 - 必要文件不存在")
+                    logger.warning("跳过此次更新 - 必要文件不存在")
                     
             except Exception as e:
-                safe_log_error(logger, "更新循环异常", e)
-                time.sleep(60)  # 异常时等待1分钟再继续
+                logger.error("更新循环异常: %s", e)
+                if self._stop_event.wait(60):  # 异常时等待1分钟再继续
+                    break
     
     def start(self) -> bool:
         """启动token更新服务"""
         if self.is_running:
-            safe_log_warning(logger, "Token更新服务已在运行")
+            logger.warning("Token更新服务已在运行")
             return False
         
         if not self._check_files_exist():
-            safe_log_error(logger, "启动失败 - 必要文件不存在")
+            logger.error("启动失败 - 必要文件不存在")
             return False
         
-        self.is_running = True
+        self._stop_event.clear()
         self.update_thread = threading.Thread(target=self._update_loop, daemon=True)
         self.update_thread.start()
         
-        safe_log_info(logger, "Token更新服务已启动")
+        logger.info("Token更新服务已启动")
         return True
     
     def stop(self):
         """停止token更新服务"""
+        # 取消进行中的更新（包括强制更新），未开始的账户登录不再执行
+        if self._update_cancel is not None:
+            self._update_cancel.set()
+        
         if not self.is_running:
-            safe_log_warning(logger, "Token更新服务未在运行")
+            logger.warning("Token更新服务未在运行")
             return
         
-        self.is_running = False
+        self._stop_event.set()
         if self.update_thread and self.update_thread.is_alive():
             self.update_thread.join(timeout=5)
         
-        safe_log_info(logger, "Token更新服务已停止")
+        logger.info("Token更新服务已停止")
     
     def force_update(self) -> bool:
         """强制立即更新token"""
         if not self._check_files_exist():
-            safe_log_error(logger, "强制更新失败 - 必要文件不存在")
+            logger.error("强制更新失败 - 必要文件不存在")
             return False
         
-        safe_log_info(logger, "执行强制token更新")
+        logger.info("执行强制token更新")
         return self._run_token_update()
     
     async def force_update_async(self) -> bool:
         """异步强制立即更新token"""
-        import asyncio
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.force_update)
+        return await asyncio.to_thread(self.force_update)
     
     def get_status(self) -> dict:
         """获取更新服务状态"""
@@ -297,17 +381,10 @@ class TokenUpdater:
             "is_running": self.is_running,
             "is_updating": self.is_updating,
             "update_interval": self.update_interval,
-            "last_update": self.last_update.isoformat() if self.last_update else None,
+            "last_update": self._last_update_iso,
             "update_count": self.update_count,
             "error_count": self.error_count,
             "last_error": self.last_error,
-            "next_update": (
-                (self.last_update + timedelta(seconds=self.update_interval)).isoformat()
-                if self.last_update else None
-            ),
-            "files": {
-                "get_tokens_script": os.path.exists(self.get_tokens_script),
-                "accounts_file": os.path.exists(self.accounts_file),
-                "tokens_file": os.path.exists(self.tokens_file)
-            }
+            "next_update": self._next_update_iso,
+            "files": dict(self._files_present(NumericConstants.TOKEN_FILES_STATUS_CACHE_TTL))
         }
\ No newline at end of file
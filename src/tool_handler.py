@@ -325,39 +325,54 @@ class ToolHandler:
     
     def _content_to_string(self, content) -> str:
         """将各种格式的内容转换为字符串"""
+        # 按精确类型判断：str和None直接返回，不经过额外的函数调用；子类等其他类型走兜底处理
+        content_type = type(content)
+        if content_type is str:
+            return content
         if content is None:
             return ""
+        if content_type is list:
+            return self._list_content_to_string(content)
+        return self._other_content_to_string(content)
+    
+    def _list_content_to_string(self, content: list) -> str:
+        """将内容片段列表拼接为字符串，图像片段使用占位符"""
+        parts = []
+        for p in content:
+            if hasattr(p, 'text'):  # ContentPart object
+                if getattr(p, 'text', None):
+                    parts.append(getattr(p, 'text', ''))
+            elif isinstance(p, dict):
+                if p.get("type") == ContentConstants.TEXT_TYPE:
+                    parts.append(p.get("text", ""))
+                elif p.get("type") == ContentConstants.IMAGE_URL_TYPE:
+                    # 处理图像内容，添加描述性文本
+                    parts.append(ContentConstants.IMAGE_PLACEHOLDER)
+            elif isinstance(p, str):
+                parts.append(p)
+            else:
+                # 处理其他类型的对象
+                try:
+                    if hasattr(p, '__dict__'):
+                        # 如果是对象，尝试获取text属性或转换为字符串
+                        text_attr = getattr(p, 'text', None)
+                        if text_attr:
+                            parts.append(str(text_attr))
+                    else:
+                        parts.append(str(p))
+                except:
+                    continue
+        return " ".join(parts)
+    
+    def _other_content_to_string(self, content) -> str:
+        """兜底转换：处理str/list子类及其他类型"""
         if isinstance(content, str):
             return content
         if isinstance(content, list):
-            parts = []
-            for p in content:
-                if hasattr(p, 'text'):  # ContentPart object
-                    if getattr(p, 'text', None):
-                        parts.append(getattr(p, 'text', ''))
-                elif isinstance(p, dict):
-                    if p.get("type") == ContentConstants.TEXT_TYPE:
-                        parts.append(p.get("text", ""))
-                    elif p.get("type") == ContentConstants.IMAGE_URL_TYPE:
-                        # 处理图像内容，添加描述性文本
-                        parts.append(ContentConstants.IMAGE_PLACEHOLDER)
-                elif isinstance(p, str):
-                    parts.append(p)
-                else:
-                    # 处理其他类型的对象
-                    try:
-                        if hasattr(p, '__dict__'):
-                            # 如果是对象，尝试获取text属性或转换为字符串
-                            text_attr = getattr(p, 'text', None)
-                            if text_attr:
-                                parts.append(str(text_attr))
-                        else:
-                            parts.append(str(p))
-                    except:
-                        continue
-            return " ".join(parts)
+            return self._list_content_to_string(content)
         # 处理其他类型
         try:
             return str(content)
         except:
-            return ""
\ No newline at end of file
+            return ""
+
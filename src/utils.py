@@ -4,15 +4,76 @@
 """
 import logging
 import sys
+import time
 
-def safe_log_error(logger: logging.Logger, message: str, exception: Exception = None):
+# 秒级时间戳缓存: [epoch秒, 上次刷新时的monotonic时间]
+_epoch_cache = [0, float("-inf")]
+
+def current_epoch() -> int:
     """
-    安全地记录错误日志，避免编码问题
+    获取当前Unix时间戳（秒），每秒最多刷新一次
+
+    用于响应中的created等只需秒级精度的字段，避免每个chunk都调用time.time()
+
+    Returns:
+        int: 当前Unix时间戳（秒）
+    """
+    now = time.monotonic()
+    if now - _epoch_cache[1] >= 1.0:
+        _epoch_cache[0] = int(time.time())
+        _epoch_cache[1] = now
+    return _epoch_cache[0]
+
+def _sanitize_text(text: str) -> str:
+    """
+    将字符串转换为可安全编码的UTF-8文本
+    
+    纯ASCII字符串直接返回，只有包含非ASCII字符时才做编码往返（替换无法编码的字符）
+    """
+    if text.isascii():
+        return text
+    return text.encode('utf-8', errors='replace').decode('utf-8')
+
+class SafeEncodingFilter(logging.Filter):
+    """
+    日志编码过滤器：只在消息包含无法编码的字符时才改写记录
+    
+    过滤器在级别判断之后运行，被级别过滤掉的日志不会产生任何清理开销
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        try:
+            message = record.getMessage()
+        except Exception:
+            # 格式化参数有误时交给logging自身的错误处理
+            return True
+        if not message.isascii():
+            try:
+                message.encode('utf-8')
+            except UnicodeEncodeError:
+                record.msg = message.encode('utf-8', errors='replace').decode('utf-8')
+                record.args = ()
+        return True
+
+def install_safe_encoding_filter():
+    """
+    在根日志记录器的处理器上安装SafeEncodingFilter（重复调用不会重复安装）
+    
+    子记录器传播上来的日志不会经过根记录器自身的过滤器，因此挂在处理器上
+    """
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, SafeEncodingFilter) for f in handler.filters):
+            handler.addFilter(SafeEncodingFilter())
+
+def _safe_log(log_method, message: str, exception: Exception = None, label: str = ""):
+    """
+    safe_log_*的公共实现
     
     Args:
-        logger: 日志记录器
-        message: 错误消息
+        log_method: 日志方法（logger.error/info/warning）
+        message: 日志消息
         exception: 异常对象（可选）
+        label: 兜底输出中使用的级别标签
     """
     try:
         # 确保消息是字符串类型
@@ -22,12 +83,7 @@ def safe_log_error(logger: logging.Logger, message: str, exception: Exception =
         if exception:
             # 安全地处理异常信息，避免编码问题
             try:
-                error_msg = str(exception)
-                # 处理可能的编码问题
-                if isinstance(error_msg, bytes):
-                    error_msg = error_msg.decode('utf-8', errors='replace')
-                else:
-                    error_msg = error_msg.encode('utf-8', errors='replace').decode('utf-8')
+                error_msg = _sanitize_text(str(exception))
             except Exception:
                 error_msg = repr(exception)
             
@@ -37,27 +93,34 @@ def safe_log_error(logger: logging.Logger, message: str, exception: Exception =
         
         # 确保消息本身也是安全的
         try:
-            if isinstance(full_message, bytes):
-                safe_message = full_message.decode('utf-8', errors='replace')
-            else:
-                safe_message = full_message.encode('utf-8', errors='replace').decode('utf-8')
+            safe_message = _sanitize_text(full_message)
         except Exception:
             safe_message = repr(full_message)
         
-        logger.error(safe_message)
+        log_method(safe_message)
         
     except Exception as e:
         # 如果连安全日志都失败了，使用最基本的方式记录
         try:
-            fallback_msg = f"Logging error: {repr(e)}, Original: {repr(message)}"
-            logger.error(fallback_msg)
+            log_method(f"Logging {label}error: {repr(e)}, Original: {repr(message)}")
         except Exception:
             # 最后的保险措施 - 直接打印到控制台
             try:
-                print(f"CRITICAL LOGGING FAILURE: {repr(message)}", file=sys.stderr)
+                print(f"CRITICAL {label.upper()}LOGGING FAILURE: {repr(message)}", file=sys.stderr)
             except Exception:
                 pass  # 如果连print都失败了，就放弃
 
+def safe_log_error(logger: logging.Logger, message: str, exception: Exception = None):
+    """
+    安全地记录错误日志，避免编码问题
+    
+    Args:
+        logger: 日志记录器
+        message: 错误消息
+        exception: 异常对象（可选）
+    """
+    _safe_log(logger.error, message, exception)
+
 def safe_log_info(logger: logging.Logger, message: str):
     """
     安全地记录信息日志，避免编码问题
@@ -66,31 +129,7 @@ def safe_log_info(logger: logging.Logger, message: str):
         logger: 日志记录器
         message: 信息消息
     """
-    try:
-        # 确保消息是字符串类型
-        if not isinstance(message, str):
-            message = str(message)
-        
-        # 确保消息是安全的
-        try:
-            if isinstance(message, bytes):
-                safe_message = message.decode('utf-8', errors='replace')
-            else:
-                safe_message = message.encode('utf-8', errors='replace').decode('utf-8')
-        except Exception:
-            safe_message = repr(message)
-        
-        logger.info(safe_message)
-        
-    except Exception as e:
-        try:
-            fallback_msg = f"Logging info error: {repr(e)}, Original: {repr(message)}"
-            logger.info(fallback_msg)
-        except Exception:
-            try:
-                print(f"CRITICAL INFO LOGGING FAILURE: {repr(message)}", file=sys.stderr)
-            except Exception:
-                pass
+    _safe_log(logger.info, message, label="info ")
 
 def safe_log_warning(logger: logging.Logger, message: str):
     """
@@ -100,31 +139,7 @@ def safe_log_warning(logger: logging.Logger, message: str):
         logger: 日志记录器
         message: 警告消息
     """
-    try:
-        # 确保消息是字符串类型
-        if not isinstance(message, str):
-            message = str(message)
-        
-        # 确保消息是安全的
-        try:
-            if isinstance(message, bytes):
-                safe_message = message.decode('utf-8', errors='replace')
-            else:
-                safe_message = message.encode('utf-8', errors='replace').decode('utf-8')
-        except Exception:
-            safe_message = repr(message)
-        
-        logger.warning(safe_message)
-        
-    except Exception as e:
-        try:
-            fallback_msg = f"Logging warning error: {repr(e)}, Original: {repr(message)}"
-            logger.warning(fallback_msg)
-        except Exception:
-            try:
-                print(f"CRITICAL WARNING LOGGING FAILURE: {repr(message)}", file=sys.stderr)
-            except Exception:
-                pass
+    _safe_log(logger.warning, message, label="warning ")
 
 def safe_str(obj) -> str:
     """
@@ -140,8 +155,8 @@ def safe_str(obj) -> str:
         if isinstance(obj, bytes):
             return obj.decode('utf-8', errors='replace')
         elif isinstance(obj, str):
-            return obj.encode('utf-8', errors='replace').decode('utf-8')
+            return _sanitize_text(obj)
         else:
-            return str(obj).encode('utf-8', errors='replace').decode('utf-8')
+            return _sanitize_text(str(obj))
     except Exception:
         return repr(obj)
\ No newline at end of file
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+tokens文件解析测试：_parse_token_lines的结果必须与原先逐行strip()/startswith('#')的结果一致
+"""
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.token_manager import _parse_token_lines
+
+
+def legacy_parse(text: str) -> list:
+    """原先的解析方式：文本模式逐行读取，去掉首尾空白，跳过空行和注释行"""
+    tokens = []
+    for line in io.StringIO(text, newline=None).readlines():
+        token = line.strip()
+        if token and not token.startswith('#'):
+            tokens.append(token)
+    return tokens
+
+
+def test_cases_match_legacy_parse():
+    cases = [
+        "",
+        "tok1\ntok2\n",
+        "tok1\r\ntok2\r\n",
+        "tok\r\rtok2\n",
+        "tok1\rtok2",
+        "# comment\n  tok1  \n\n#tok2\n   # indented comment\n",
+        "　tok1　\n\x1ctok2\x85\n",
+        "tok a\x85b\n",
+        "a#b\n #\n#\n",
+        "\t\f\vtok\t\f\v\r\n",
+        "tok tok2\n",
+    ]
+    for text in cases:
+        assert _parse_token_lines(text) == legacy_parse(text), repr(text)
+
+
+def test_random_text_matches_legacy_parse():
+    alphabet = ["a", "b", "#", " ", "\t", "\r", "\n", "\r\n", "　", "\x1c", "\x85", " ", "\f", "\v"]
+    rng = random.Random(0)
+    for _ in range(5000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        assert _parse_token_lines(text) == legacy_parse(text), repr(text)